@@ -1,4 +1,3 @@
-import math
 import os
 import pandas as pd
 import numpy as np
@@ -11,6 +10,7 @@ from dtk.interventions.irs import add_IRS
 from dtk.interventions.itn_age_season import add_ITN_age_season
 from dtk.interventions.health_seeking import add_health_seeking
 from malaria.interventions.malaria_drug_campaigns import add_drug_campaign
+from malaria.interventions.campaign_compression import compress_node_table
 
 
 interventions_folder = "./inputs/"
@@ -28,28 +28,6 @@ def add_regional_EIR_node(cb):
 
 
 
-# Input: intervention_df = pd.read_csv("grid_itn_events.csv")
-# format: interventions by grid cell.  Has columns for "grid_cell", "fulldate", "simday"
-def try_campaign_compression(intervention_df, field_list, bin_fidelity=0.1, simday_fidelity=10):
-    def round_nearest(x, a):
-        rounded = round(round(x / a) * a, -int(math.floor(math.log10(a))))
-        return rounded
-
-    binned_intervention_df = intervention_df.copy(deep=True)
-
-    # Bin these fields with bin width = bin_fidelity
-    for field in field_list:
-        binned_intervention_df[field] = intervention_df[field].map(lambda x: round_nearest(x, bin_fidelity))
-
-    binned_intervention_df['simday'] = intervention_df['simday'].map(lambda x: round_nearest(x, simday_fidelity))
-
-    # Group by the new binned fields, as well as by date
-    data_fields = ['simday'] + field_list
-    binned_and_grouped = binned_intervention_df.groupby(data_fields)
-
-    return [binned_intervention_df, binned_and_grouped, data_fields]
-
-
 # All of the following functions add_X require input of a dataframe with the following format:
 # simday: day of simulation to implement the intervention
 # grid_cell: node ID to implement intervention on
@@ -57,12 +35,7 @@ def try_campaign_compression(intervention_df, field_list, bin_fidelity=0.1, simd
 
 def add_hs(cb, events_df):
     hs_field_list = ["cov_newclin_youth", "cov_newclin_adult", "cov_severe_youth", "cov_severe_adult", "duration"]
-    binned_intervene_events, binned_and_grouped, data_fields = try_campaign_compression(events_df, hs_field_list)
-
-    for table, group in binned_and_grouped:
-        table_dict = dict(zip((data_fields), table))
-
-        node_list = sorted(group['grid_cell'])
+    for table_dict, node_list in compress_node_table(events_df, hs_field_list):
         node_dict = {"class": "NodeSetNodeList", "Node_List": node_list}
 
         add_health_seeking(cb,
@@ -100,18 +73,14 @@ def add_hs(cb, events_df):
 
 def add_itn(cb, events_df):
     itn_field_list = ["age_cov", "cov_all", "min_season_cov", "fast_fraction"]
-    binned_intervene_events, binned_and_grouped, data_fields = try_campaign_compression(events_df, itn_field_list)
 
     birthnet_df = events_df.copy(deep=True)
     birthnet_df.sort_values(by='simday', inplace=True)
     birthnet_df['duration'] = birthnet_df.groupby('grid_cell')['simday'].shift(-1).sub(birthnet_df['simday'])
     birthnet_df['duration'].fillna(-1, inplace=True)
     birthnet_field_list = itn_field_list + ["duration"]
-    BIRTH_binned_intervene_events, BIRTH_binned_and_grouped, BIRTH_data_fields = try_campaign_compression(birthnet_df, birthnet_field_list)
 
-    for table, group in binned_and_grouped:
-        table_dict = dict(zip((data_fields), table))
-        node_list = sorted(list(set(group['grid_cell']))) # fixme Needed to add this because sometimes there are duplicate nodes in the list, and this breaks things
+    for table_dict, node_list in compress_node_table(events_df, itn_field_list):
 
         start = float(table_dict['simday'])
         if start >= 0:
@@ -131,9 +100,7 @@ def add_itn(cb, events_df):
                                nodeIDs=node_list)
 
     # Birthnet distribution
-    for table, group in BIRTH_binned_and_grouped:
-        table_dict = dict(zip((BIRTH_data_fields), table))
-        node_list = sorted(group['grid_cell'])
+    for table_dict, node_list in compress_node_table(birthnet_df, birthnet_field_list):
 
         start = float(table_dict['simday'])
         if start >= 0:
@@ -156,11 +123,7 @@ def add_itn(cb, events_df):
 
 def add_irs(cb, events_df):
     irs_field_list = ["cov_all", "killing", "exp_duration", "box_duration"]
-    binned_intervene_events, binned_and_grouped, data_fields = try_campaign_compression(events_df, irs_field_list)
-
-    for table, group in binned_and_grouped:
-        table_dict = dict(zip((data_fields), table))
-        node_list = sorted(group['grid_cell'])
+    for table_dict, node_list in compress_node_table(events_df, irs_field_list):
 
         add_IRS(cb, start=int(table_dict['simday']),
                 coverage_by_ages=[{'coverage': float(table_dict['cov_all'])}],
@@ -175,11 +138,7 @@ def add_irs(cb, events_df):
 
 def add_mda(cb, events_df):
     mda_field_list = ["cov_all"]
-    binned_intervene_events, binned_and_grouped, data_fields = try_campaign_compression(events_df, mda_field_list)
-
-    for table, group in binned_and_grouped:
-        table_dict = dict(zip((data_fields), table))
-        node_list = sorted(group['grid_cell'])
+    for table_dict, node_list in compress_node_table(events_df, mda_field_list):
 
         add_drug_campaign(cb,
                           campaign_type='MDA',
@@ -193,23 +152,18 @@ def add_mda(cb, events_df):
 
 def add_rcd(cb, events_df):
     rcd_field_list = ["coverage", "trigger_coverage", "interval"]
-    binned_intervene_events, binned_and_grouped, data_fields = try_campaign_compression(events_df, rcd_field_list)
-
-    for table, group in binned_and_grouped:
-        table_dict = dict(zip((data_fields), table))
-        node_list = sorted(group['grid_cell'])
-
-        for i in range(len(events_df)):
-            add_drug_campaign(cb,
-                              campaign_type='rfMSAT',
-                              drug_code='AL',
-                              diagnostic_type='BLOOD_SMEAR_PARASITES',
-                              diagnostic_threshold=0,
-                              start_days=[float(table_dict['simday'])],
-                              coverage=float(table_dict['coverage']),
-                              trigger_coverage=float(table_dict['trigger_coverage']),
-                              interval=float(table_dict['interval']),
-                              nodes=node_list)
+    for table_dict, node_list in compress_node_table(events_df, rcd_field_list):
+
+        add_drug_campaign(cb,
+                          campaign_type='rfMSAT',
+                          drug_code='AL',
+                          diagnostic_type='BLOOD_SMEAR_PARASITES',
+                          diagnostic_threshold=0,
+                          start_days=[float(table_dict['simday'])],
+                          coverage=float(table_dict['coverage']),
+                          trigger_coverage=float(table_dict['trigger_coverage']),
+                          interval=float(table_dict['interval']),
+                          nodes=node_list)
 
 
 
@@ -4,6 +4,7 @@ from simtools.ExperimentManager.ExperimentManagerFactory import ExperimentManage
 from examples.magude_multinode.build_cb import build_project_cb
 from examples.magude_multinode.interventions import add_all_interventions
 from examples.magude_multinode.reports import add_all_reports
+from malaria.interventions.campaign_writer import streaming_campaign
 
 # Run parameters:
 run_priority = "Highest"
@@ -12,7 +13,13 @@ experiment_name = "CoreMagude_Test"
 
 if __name__ == '__main__':
     cb = build_project_cb()
-    add_all_interventions(cb, sim_start_date="2010-01-01")
+    # Tens of thousands of grid-cell events: write them to the campaign file as they are built.
+    # The file is only written locally: upload it with the experiment assets, which the simulations read from
+    # ./Assets, and add every campaign event inside the block.
+    campaign_file = "./inputs/campaign_magude.json"
+    with streaming_campaign(cb, campaign_file, campaign_filename="Assets/campaign_magude.json"):
+        add_all_interventions(cb, sim_start_date="2010-01-01")
+    cb.experiment_files.add_file(campaign_file)
     add_all_reports(cb)
 
 
@@ -3,6 +3,7 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 from simtools.Analysis.BaseAnalyzers import BaseAnalyzer
+from malaria.analyzers.MalariaSummaryReport import MalariaSummaryReport
 
 
 class PrevalenceAnalyzer(BaseAnalyzer):
@@ -20,23 +21,18 @@ class PrevalenceAnalyzer(BaseAnalyzer):
 
     def select_simulation_data(self, data, simulation):
 
-        alldata = data[self.filenames[0]]
-        age_bins = alldata['Metadata']['Age Bins']
-        parasite_bins = alldata['Metadata']['Parasitemia Bins']
+        report = MalariaSummaryReport(data[self.filenames[0]], channels=[self.data_channel])
+        age_bins = report.bins['Age Bin']
+        parasite_bins = report.bins['PfPR Bin'].astype(float)
         if parasite_bins[-1] > 1e7 :
             parasite_bins[-1] = 1e7
-        pr = alldata[self.data_channel_type][self.data_channel][:-1]
-
-        simdata = pd.DataFrame()
-        for m, par in enumerate(pr):
-            df = pd.DataFrame.from_records(par, columns=age_bins)
-            df = df.stack().reset_index()
-            df = df.rename(columns={'level_1': 'age',
-                                    0: self.channel_name})
-            df['density_bin'] = df['level_0'].apply(lambda x: parasite_bins[x])
-            del df['level_0']
-            df['day'] = m
-            simdata = pd.concat([simdata, df])
+        pr = report.array(self.data_channel)[:-1]  # (time, density bin, age bin)
+
+        num_days, num_density_bins, num_age_bins = pr.shape
+        simdata = pd.DataFrame({'age': np.tile(age_bins, num_days * num_density_bins),
+                                self.channel_name: pr.ravel(),
+                                'density_bin': np.tile(np.repeat(parasite_bins, num_age_bins), num_days),
+                                'day': np.repeat(np.arange(num_days), num_density_bins * num_age_bins)})
 
         for sweep_var in self.sweep_variables:
             if sweep_var in simulation.tags.keys():
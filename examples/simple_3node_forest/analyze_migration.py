@@ -2,6 +2,7 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 from simtools.Analysis.BaseAnalyzers import BaseAnalyzer
+from malaria.analyzers.Helpers import pair_trips
 
 # requires malaria-toolbox installed
 from plotting.colors import load_color_palette
@@ -36,6 +37,7 @@ class MigrationCountAnalyzer(BaseAnalyzer) :
 
         adf = pd.concat(selected).reset_index(drop=True)
         num_migration_types = len(adf['MigrationType'].unique())
+        trips = pair_trips(adf, by=['MigrationType', 'Run_Number'])
 
         sns.set_style('white', {'axes.linewidth' : 0.5})
         palette = load_color_palette()
@@ -43,31 +45,27 @@ class MigrationCountAnalyzer(BaseAnalyzer) :
         fig.subplots_adjust(right=0.98, left=0.05, wspace=0.25)
 
         for m, (mig, mdf) in enumerate(adf.groupby('MigrationType')) :
+            # trips and traveler ages at departure, from the paired events
+            tdf = trips[trips['MigrationType'] == mig]
+
             ax = fig.add_subplot(num_migration_types, 4, m*4+1)
-            num_events = mdf.groupby('Run_Number')['Event'].agg(len).values
-            sns.distplot(num_events, ax=ax, color=palette[m], label=mig)
+            num_trips = tdf.groupby('Run_Number').size().reindex(mdf['Run_Number'].unique(), fill_value=0).values
+            sns.distplot(num_trips, ax=ax, color=palette[m], label=mig)
             ax.set_xlabel('number of trips')
             ax.set_ylabel('frac of sims')
             ax.legend()
 
             ax = fig.add_subplot(num_migration_types, 4, m*4+2)
-            for r, rdf in mdf.groupby('Run_Number') :
+            for r, rdf in tdf.groupby('Run_Number') :
                 sns.kdeplot(rdf['AgeYears'], ax=ax, color=palette[m], linewidth=0.5, alpha=0.5, label='')
-            sns.kdeplot(mdf['AgeYears'], ax=ax, color=palette[m], label='')
+            sns.kdeplot(tdf['AgeYears'], ax=ax, color=palette[m], label='')
             ax.set_xlabel('Traveler age')
             ax.set_ylabel('fraction of trips')
             ax.set_xlim(-5, 205)
 
             ax = fig.add_subplot(num_migration_types, 4, m*4+3)
-            for r, rdf in mdf.groupby('Run_Number') :
-                trip_durations = []
-                grouped = rdf.groupby('IndividualID')
-                for gn, gdf in grouped :
-                    t = gdf['Time'].values
-                    d = [t[2*x+1] - t[2*x] for x in range(int(len(t)/2))]
-                    trip_durations.extend(d)
-
-                sns.kdeplot(trip_durations, ax=ax, linewidth=0.5, color=palette[m])
+            for r, rdf in tdf.groupby('Run_Number') :
+                sns.kdeplot(rdf['Duration'].values, ax=ax, linewidth=0.5, color=palette[m])
             ax.set_xlabel('days at destination')
             ax.set_ylabel('fraction of trips')
 
@@ -1,28 +1,42 @@
 import logging
 import threading
+from collections import OrderedDict
+
+import numpy as np
 import pandas as pd
 from calibtool.analyzers.BaseComparisonAnalyzer import BaseComparisonAnalyzer
 
+from malaria.analyzers.SampleAccumulator import SampleAccumulator
+from malaria.analyzers.CompactCache import cache_name, write_compact_cache
+
 logger = logging.getLogger(__name__)
 thread_lock = threading.Lock()
 
 
 class BaseSummaryCalibrationAnalyzer(BaseComparisonAnalyzer):
 
+    # Optional likelihood evaluating all samples in one call, called as batch_compare_fn(data, reference):
+    # set on a subclass as batch_compare_fn = staticmethod(BatchLLCalculators.gamma_poisson),
+    # or on an instance in __init__ as self.batch_compare_fn = BatchLLCalculators.gamma_poisson
+    batch_compare_fn = None
+
+    # 'compact' writes cache() samples to one array file in cache_dir instead of lists in the iteration state
+    cache_format = 'json'
+    cache_dir = 'compact_cache'  # relative to the calibration directory, see CompactCache.set_root
+
     def combine(self, parsers):
         """
         Combine the simulation data into a single table for all analyzed simulations.
         """
 
-        selected = [p.selected_data[id(self)] for p in parsers.values() if id(self) in p.selected_data]
+        selected = (p.selected_data[id(self)] for p in parsers.values() if id(self) in p.selected_data)
 
-        # Stack selected_data from each parser, adding unique (sim_id) and shared (sample) levels to MultiIndex
-        combine_levels = ['sample', 'sim_id', 'channel']
-        combined = pd.concat(selected, axis=1,
-                             keys=[(d.sample, d.sim_id) for d in selected],
-                             names=combine_levels)
+        # Fold selected_data from each parser into running means over simulations sharing a sample
+        accumulator = SampleAccumulator()
+        for d in selected:
+            accumulator.add(d.sample, d)
 
-        self.data = combined.groupby(level=['sample', 'channel'], axis=1).mean()
+        self.data = accumulator.mean()
         logger.debug(self.data)
 
     @staticmethod
@@ -41,7 +55,10 @@ class BaseSummaryCalibrationAnalyzer(BaseComparisonAnalyzer):
         """
         Calculate the output result for each sample.
         """
-        self.result = self.data.groupby(level='sample', axis=1).apply(self.compare)
+        if self.batch_compare_fn:
+            self.result = self.batch_compare_fn(self.data, self.reference)
+        else:
+            self.result = self.data.groupby(level='sample', axis=1).apply(self.compare)
         logger.debug(self.result)
 
     def cache(self):
@@ -53,8 +70,27 @@ class BaseSummaryCalibrationAnalyzer(BaseComparisonAnalyzer):
         tmp_ref.columns = pd.MultiIndex.from_tuples([('ref', x) for x in tmp_ref.columns])
 
         cache = pd.concat([self.data, tmp_ref], axis=1).dropna()
+        if self.cache_format == 'compact':
+            return self.serialize_compact(cache)
         return self.serialize(cache)  # Return in serializable format
 
+    def serialize_compact(self, df):
+        """
+        As serialize, but with the samples written to a (samples x bins x channels) array file
+        and replaced by references that CompactCache.resolve turns back into sample dicts
+        """
+        samples = sorted(x for x in df.columns.levels[0].tolist() if x != 'ref')
+        output = {'samples': []}
+        if samples:
+            channels = df[samples[0]].columns.tolist()
+            values = np.stack([df[sample][channels].values for sample in samples])
+            bin_frame = df.index.to_frame(index=False)
+            bins = OrderedDict((name, bin_frame[name].values) for name in bin_frame.columns)
+            output['samples'] = write_compact_cache(self.cache_dir, cache_name(self), samples, bins, channels, values)
+        if 'ref' in df.columns.levels[0]:
+            output['ref'] = df['ref'].reset_index().to_dict(orient='list')
+        return output
+
     @staticmethod
     def serialize(df):
         """
@@ -92,9 +128,9 @@ class BaseSummaryCalibrationAnalyzer(BaseComparisonAnalyzer):
 
         """
 
-        samples = sorted(df.columns.levels[0].tolist())
-        output = {'samples': [df[sample].reset_index().to_dict(orient='list') for sample in samples if sample != 'ref']}
-        if 'ref' in samples:
+        samples = sorted(x for x in df.columns.levels[0].tolist() if x != 'ref')
+        output = {'samples': [df[sample].reset_index().to_dict(orient='list') for sample in samples]}
+        if 'ref' in df.columns.levels[0]:
             output['ref'] = df['ref'].reset_index().to_dict(orient='list')
         return output
 
@@ -0,0 +1,137 @@
+"""
+Likelihoods evaluated for every calibration sample in one vectorized call.
+
+Each function takes the combined simulation data (bins x (sample, channel) columns, as produced by
+SampleAccumulator.mean) and the reference data (bins x channel), aligns all samples against the reference once,
+and returns a pandas.Series of log-likelihoods indexed by sample. Each is the calibtool.LL_calculators function
+of the same name (with the _pandas suffix) applied to join_reference(sample, reference) for every sample:
+a (sample, bin) pair only contributes when neither the simulation nor the reference value is missing,
+and bins are summed or averaged as that function does.
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+from scipy.special import gammaln
+
+logger = logging.getLogger(__name__)
+
+
+def align_samples(data, reference, channels):
+    """
+    Align all samples of the combined simulation data on the reference bins
+    :param data: pandas.DataFrame indexed on bins with (sample, channel) MultiIndex columns
+    :param reference: pandas.DataFrame indexed on bins with channel columns
+    :param channels: channels to align
+    :return: (samples, simulation and reference {channel: (samples x bins) array} zeroed where masked,
+              (samples x bins) boolean mask of bins to include)
+    """
+    data = data.reindex(reference.index)
+    samples = data.columns.get_level_values('sample').unique()
+
+    sim, ref = {}, {}
+    mask = np.ones((len(samples), len(reference.index)), dtype=bool)
+    for channel in channels:
+        columns = pd.MultiIndex.from_product([samples, [channel]])
+        sim[channel] = data.reindex(columns=columns).values.T.astype(np.float64)
+        ref[channel] = reference[channel].values.astype(np.float64)
+        mask &= ~np.isnan(sim[channel]) & ~np.isnan(ref[channel])
+
+    # join_reference drops a sample's bin if any of its columns is missing
+    for column in data.columns.get_level_values('channel').unique().difference(channels):
+        columns = pd.MultiIndex.from_product([samples, [column]])
+        mask &= ~np.isnan(data.reindex(columns=columns).values.T.astype(np.float64))
+    for column in reference.columns.difference(channels):
+        mask &= ~np.isnan(reference[column].values.astype(np.float64))
+
+    for channel in channels:
+        sim[channel] = np.where(mask, sim[channel], 0)
+        ref[channel] = np.where(mask, ref[channel], 0)
+
+    return samples, sim, ref, mask
+
+
+def mean_over_bins(ll, mask, samples):
+    """
+    Mean log-likelihood over the bins of each sample that are in the joined frame, as LL.mean() per sample
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return pd.Series(np.where(mask, ll, 0).sum(axis=1) / mask.sum(axis=1), index=samples)
+
+
+def beta_binomial(data, reference):
+    """
+    Batched calibtool.LL_calculators.beta_binomial_pandas: beta-binomial likelihood of reference Observations
+    out of Trials, given a Beta posterior on the rate from simulated Observations out of Trials with a uniform prior,
+    averaged over bins
+    """
+    samples, sim, ref, mask = align_samples(data, reference, ['Observations', 'Trials'])
+    sim_obs, sim_trials = sim['Observations'], sim['Trials']
+    ref_obs, ref_trials = ref['Observations'], ref['Trials']
+
+    ll = gammaln(ref_trials + 1) + gammaln(sim_trials + 2) - gammaln(ref_trials + sim_trials + 2) \
+        + gammaln(ref_obs + sim_obs + 1) + gammaln(ref_trials - ref_obs + sim_trials - sim_obs + 1) \
+        - gammaln(ref_obs + 1) - gammaln(ref_trials - ref_obs + 1) \
+        - gammaln(sim_obs + 1) - gammaln(sim_trials - sim_obs + 1)
+
+    return mean_over_bins(ll, mask, samples)
+
+
+def gamma_poisson(data, reference):
+    """
+    Batched calibtool.LL_calculators.gamma_poisson_pandas: gamma-Poisson (negative binomial) likelihood of reference
+    Observations in Trials (person-time), given a Gamma posterior on the rate from simulated Observations in Trials
+    with a flat prior, averaged over bins
+    """
+    samples, sim, ref, mask = align_samples(data, reference, ['Observations', 'Trials'])
+    sim_obs, sim_trials = sim['Observations'], sim['Trials']
+    ref_obs, ref_trials = ref['Observations'], ref['Trials']
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ll = gammaln(ref_obs + sim_obs + 1) - gammaln(ref_obs + 1) - gammaln(sim_obs + 1) \
+            + ref_obs * np.log(ref_trials) + (sim_obs + 1) * np.log(sim_trials) \
+            - (ref_obs + sim_obs + 1) * np.log(ref_trials + sim_trials)
+
+    return mean_over_bins(ll, mask, samples)
+
+
+def dirichlet_multinomial(data, reference, channel='Counts'):
+    """
+    Batched calibtool.LL_calculators.dirichlet_multinomial_pandas: Dirichlet-multinomial likelihood of reference counts
+    across the last index level (e.g. PfPR Bin), given a Dirichlet posterior from simulated counts with a uniform prior,
+    summed over the groups of the other levels
+    """
+    samples, sim, ref, mask = align_samples(data, reference, [channel])
+    x, alpha = ref[channel], sim[channel] + 1
+
+    index = reference.index
+    if isinstance(index, pd.MultiIndex) and index.nlevels > 1:
+        codes = pd.factorize(index.droplevel(-1))[0]
+    else:
+        codes = np.zeros(len(index), dtype=np.int64)
+
+    # per-group sums for every sample at once: (samples x bins) . (bins x groups)
+    membership = np.zeros((len(index), codes.max() + 1 if len(codes) else 0))
+    membership[np.arange(len(index)), codes] = 1
+
+    def group_sum(a):
+        return np.where(mask, a, 0).dot(membership)
+
+    n, a = group_sum(x), group_sum(alpha)
+    observed = group_sum(np.ones_like(x)) > 0
+
+    ll_groups = np.where(observed, gammaln(n + 1) + gammaln(a) - gammaln(n + a), 0)
+    ll_bins = np.where(mask, gammaln(x + alpha) - gammaln(alpha) - gammaln(x + 1), 0)
+
+    return pd.Series(ll_groups.sum(axis=1) + ll_bins.sum(axis=1), index=samples)
+
+
+def euclidean_distance(data, reference, channel='Counts'):
+    """
+    Batched calibtool.LL_calculators.euclidean_distance_pandas: negative Euclidean distance between simulated and
+    reference values of a channel over all bins
+    """
+    samples, sim, ref, mask = align_samples(data, reference, [channel])
+    sq = np.where(mask, (sim[channel] - ref[channel]) ** 2, 0)
+
+    return pd.Series(-np.sqrt(sq.sum(axis=1)), index=samples)
@@ -4,9 +4,10 @@ import pandas as pd
 import numpy as np
 from simtools.Analysis.BaseAnalyzers import BaseCalibrationAnalyzer
 
-from malaria.analyzers.Helpers import convert_annualized, convert_to_counts, age_from_birth_cohort, aggregate_on_index
-from scipy.stats import binom
-from dtk.utils.parsers.malaria_summary import summary_channel_to_pandas
+from malaria.analyzers.Helpers import aggregate_on_index, binomial_error_bars
+from malaria.analyzers.MalariaSummaryReport import shared_summary_report
+from malaria.analyzers.SampleAccumulator import SampleAccumulator
+from malaria.analyzers.CompactCache import CompactCache
 
 from calibtool.LL_calculators import gamma_poisson_pandas, beta_binomial_pandas
 
@@ -25,6 +26,7 @@ class ChannelByAgeCohortAnalyzer(BaseCalibrationAnalyzer):
         self.filenames = ['output/MalariaSummaryReport_Annual_Report.json']
         self.population_channel = 'Average Population by Age Bin'
         self.compare_fn = compare_fn
+        self.batch_compare_fn = kwargs.get('batch_compare_fn')  # optional, e.g. BatchLLCalculators.beta_binomial
         self.site = site
         self.reference = site.get_reference_data(self.site_ref_type)
 
@@ -57,26 +59,14 @@ class ChannelByAgeCohortAnalyzer(BaseCalibrationAnalyzer):
         Extract data from output data and accumulate in same bins as reference.
         """
 
-        # Load data from simulation
-        data = data[self.filenames[0]]
+        # Load data from simulation, sharing extraction with other analyzers of the same report
+        report = shared_summary_report(data[self.filenames[0]], channels=[self.channel, self.population_channel],
+                                       sim_id=simulation.id, filename=self.filenames[0])
 
-        # Get channels by age and time series
-        channel_series = summary_channel_to_pandas(data, self.channel)
-        population_series = summary_channel_to_pandas(data, self.population_channel)
-        channel_data = pd.concat([channel_series, population_series], axis=1)
-
-        # Convert Average Population to Person Years
-        person_years = convert_annualized(channel_data[self.population_channel],
-                                          start_day=channel_series.Start_Day,
-                                          reporting_interval=channel_series.Reporting_Interval)
-        channel_data['Trials'] = person_years
-
-        # Calculate Incidents from Annual Incidence and Person Years
-        channel_data['Observations'] = convert_to_counts(channel_data[self.channel], channel_data.Trials)
-
-        # Reset multi-index and perform transformations on index columns
-        df = channel_data.reset_index()
-        df = age_from_birth_cohort(df)  # calculate age from time for birth cohort
+        # Trials = Person Years from Average Population; Observations = Incidents from Annual Incidence,
+        # with age calculated from time for birth cohort
+        df = report.birth_cohort(self.channel, self.population_channel, annualized=True)
+        df = df.rename(columns={self.channel: 'Observations'})
 
         # Re-bin according to reference and return single-channel Series
         sim_data = aggregate_on_index(df, self.reference.index, keep=['Observations', 'Trials'])
@@ -102,15 +92,16 @@ class ChannelByAgeCohortAnalyzer(BaseCalibrationAnalyzer):
         """
         Calculate the output result for each sample.
         """
-        selected = list(all_data.values())
+        # Fold selected_data from each simulation into running means over simulations sharing a sample
+        accumulator = SampleAccumulator()
+        for simulation, sim_data in all_data.items():
+            accumulator.add(simulation.tags.get('__sample_index__'), sim_data)
 
-        # Stack selected_data from each parser, adding unique (sim_id) and shared (sample) levels to MultiIndex
-        combine_levels = ['sample', 'sim_id', 'channel']
-        combined = pd.concat(selected, axis=1,
-                             keys=[(s.tags.get('__sample_index__'), s.id) for s in all_data.keys()],
-                             names=combine_levels)
+        data = accumulator.mean()
 
-        data = combined.groupby(level=['sample', 'channel'], axis=1).mean()
+        # Evaluate all samples in one call when a batched likelihood is provided
+        if self.batch_compare_fn:
+            return self.batch_compare_fn(data, self.reference)
 
         return data.groupby(level='sample', axis=1).apply(self.compare)
 
@@ -121,7 +112,7 @@ class ChannelByAgeCohortAnalyzer(BaseCalibrationAnalyzer):
     @classmethod
     def plot_comparison(cls, fig, data, **kwargs):
         ax = fig.gca()
-        df = pd.DataFrame.from_dict(data, orient='columns')
+        df = pd.DataFrame.from_dict(CompactCache.resolve(data), orient='columns')
         incidence = df.Observations / df.Trials
         age_bin_left_edges = [0] + df['Age Bin'][:-1].tolist()
         age_bin_centers = 0.5 * (df['Age Bin'] + age_bin_left_edges)
@@ -146,17 +137,18 @@ class PrevalenceByAgeCohortAnalyzer(ChannelByAgeCohortAnalyzer):
 
     site_ref_type = 'prevalence_by_age'
 
+    error_bar_method = 'binom'  # or 'clopper-pearson', 'jeffreys'
+
     def __init__(self, site, weight=1, compare_fn=beta_binomial_pandas, **kwargs):
         super(PrevalenceByAgeCohortAnalyzer, self).__init__(site, weight, compare_fn, **kwargs)
 
-    @staticmethod
-    def error_bars(df):
+    @classmethod
+    def error_bars(cls, df):
         """
         Return 68% (1-sigma) binomial confidence interval.
         pyplot.errorbar expects a 2xN array of unsigned offsets relative to points
         """
-        errs = [binom.interval(0.68, n, p=k/n, loc=-k) / n for n, k in zip(df.Trials, df.Observations)]
-        return np.abs(np.array(errs).T)
+        return binomial_error_bars(df.Trials, df.Observations, confidence=0.68, method=cls.error_bar_method)
 
 
 class IncidenceByAgeCohortAnalyzer(ChannelByAgeCohortAnalyzer):
@@ -1,12 +1,12 @@
 import logging
 import pandas as pd
 
-from dtk.utils.parsers.malaria_summary import summary_channel_to_pandas
+from malaria.analyzers.MalariaSummaryReport import shared_summary_report
 
-from calibtool.analyzers.BaseCalibrationAnalyzer import BaseCalibrationAnalyzer, thread_lock
+from calibtool.analyzers.BaseCalibrationAnalyzer import BaseCalibrationAnalyzer
 from calibtool import LL_calculators
-from calibtool.analyzers.Helpers import \
-    convert_to_counts, age_from_birth_cohort, season_from_time, aggregate_on_index
+from malaria.analyzers.Helpers import aggregate_on_index
+from malaria.analyzers.CompactCache import CompactCache
 
 logger = logging.getLogger(__name__)
 
@@ -36,32 +36,23 @@ class ChannelBySeasonAgeDensityCohortAnalyzer(BaseCalibrationAnalyzer):
         Extract data from output simulation data and accumulate in same bins as reference.
         """
 
-        # Load data from simulation
-        data = parser.raw_data[self.filenames[0]]
-
-        # Population by age and time series (to convert parasite prevalence to counts)
-        population = summary_channel_to_pandas(data, self.population_channel)
+        # Load data from simulation, sharing extraction with other analyzers of the same report
+        report = shared_summary_report(parser.raw_data[self.filenames[0]],
+                                       channels=[self.population_channel] + list(self.channels),
+                                       sim_id=parser.sim_id, filename=self.filenames[0])
 
         # Coerce channel data into format for comparison with reference
         channel_data_dict = {}
         for channel in self.channels:
 
-            # Prevalence by density, age, and time series
-            channel_data = summary_channel_to_pandas(data, channel)
-
-            with thread_lock:  # TODO: re-code following block to ensure thread safety (Issue #758)?
-
-                # Calculate counts from prevalence and population
-                channel_counts = convert_to_counts(channel_data, population)
-
-                # Reset multi-index and perform transformations on index columns
-                df = channel_counts.reset_index()
-                df = age_from_birth_cohort(df)  # calculate age from time for birth cohort
-                df = season_from_time(df, seasons=self.seasons)  # calculate month from time
+            # Counts from prevalence and population by density, age, and time series,
+            # with age calculated from time for birth cohort and month calculated from time
+            df = report.birth_cohort(channel, self.population_channel,
+                                     by_season=True, seasons=self.seasons)
 
-                # Re-bin according to reference and return single-channel Series
-                rebinned = aggregate_on_index(df, self.reference.loc(axis=1)[channel].index, keep=[channel])
-                channel_data_dict[channel] = rebinned[channel].rename('Counts')
+            # Re-bin according to reference and return single-channel Series
+            rebinned = aggregate_on_index(df, self.reference.loc(axis=1)[channel].index, keep=[channel])
+            channel_data_dict[channel] = rebinned[channel].rename('Counts')
 
         sim_data = pd.concat(channel_data_dict.values(), keys=channel_data_dict.keys(), names=['Channel'])
         sim_data = pd.DataFrame(sim_data)  # single-column DataFrame for standardized combine/compare pattern
@@ -73,7 +64,7 @@ class ChannelBySeasonAgeDensityCohortAnalyzer(BaseCalibrationAnalyzer):
     @classmethod
     def plot_comparison(cls, fig, data, **kwargs):
         axs = fig.axes
-        df = pd.DataFrame.from_dict(data, orient='columns')
+        df = pd.DataFrame.from_dict(CompactCache.resolve(data), orient='columns')
         nrows, ncols = len(df.Channel.unique()), len(df.Season.unique())
         if not axs:
             fig.set_size_inches((12, 6))  # override smaller single-panel default from SiteDataPlotter
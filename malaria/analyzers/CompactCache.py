@@ -0,0 +1,169 @@
+"""
+Cache files live in a directory under the calibration directory, and the iteration state refers to them by paths
+relative to it, so that a calibration can be resumed or plotted from another directory or machine.
+Set the calibration directory before the analyzers write or plot their caches, e.g.
+
+    CompactCache.set_root(os.path.join(os.getcwd(), calib_manager.name))
+
+Each iteration writes new content-addressed files; CompactCache.clean removes the ones no longer referenced
+by the iteration states being kept, and deleting the cache directory removes all of them.
+"""
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def cache_name(analyzer):
+    """
+    :return: '<site>_<analyzer class>' naming the cache files of an analyzer
+    """
+    site = getattr(analyzer, 'site', None)
+    return '_'.join(([site.name] if site is not None else []) + [type(analyzer).__name__])
+
+
+def write_compact_cache(cache_dir, name, samples, bins, channels, values, row_channel=None):
+    """
+    Write analyzer cache() output as one (samples x bins x channels) array file plus a small JSON manifest
+    :param cache_dir: directory for the cache files, relative to the calibration directory (CompactCache.root)
+    :param name: analyzer name, e.g. '<site>_<analyzer class>'
+    :param samples: sample indices, in order of the first array axis
+    :param bins: OrderedDict of bin name -> list of bin values, in order of the second array axis
+    :param channels: channel names, in order of the third array axis
+    :param values: numpy array shaped (samples, bins, channels)
+    :param row_channel: by default each sample dict has one list per bin name and per channel;
+                        with row_channel, the sample dict holds the bin lists and row_channel: one list of
+                        channel values per bin
+    :return: list of per-sample references to put in place of the sample dicts
+    """
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    if values.shape != (len(samples), len(next(iter(bins.values()))), len(channels)):
+        raise Exception('Cache values shaped %s do not match %d samples, %d bins and %d channels' %
+                        (values.shape, len(samples), len(next(iter(bins.values()))), len(channels)))
+
+    # content-addressed, so that the caches of earlier iterations are not overwritten
+    digest = hashlib.md5(values.tobytes()).hexdigest()[:12]
+    basename = '%s_%s' % (name, digest)
+
+    directory = os.path.join(CompactCache.get_root(), cache_dir)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    np.save(os.path.join(directory, basename + '.npy'), values)
+
+    manifest = os.path.join(cache_dir, basename + '.json')
+    with open(os.path.join(CompactCache.get_root(), manifest), 'w') as f:
+        json.dump({'array': basename + '.npy',
+                   'row_channel': row_channel,
+                   'samples': [s.item() if hasattr(s, 'item') else s for s in samples],
+                   'bins': OrderedDict((k, np.asarray(v).tolist()) for k, v in bins.items()),
+                   'channels': list(channels)}, f)
+
+    return [{'compact_cache': manifest.replace(os.sep, '/'), 'sample': i} for i in range(len(samples))]
+
+
+class CompactCache(object):
+    """
+    Lazy reader for caches written by write_compact_cache; the array is memory-mapped and
+    a sample dict is only built when a plot_comparison asks for it
+    """
+
+    root = None  # calibration directory the cache paths are relative to
+    _open = OrderedDict()
+    max_open = 16
+
+    def __init__(self, manifest_path):
+        with open(manifest_path) as f:
+            self.manifest = json.load(f, object_pairs_hook=OrderedDict)
+        self.values = np.load(os.path.join(os.path.dirname(manifest_path), self.manifest['array']), mmap_mode='r')
+
+    @classmethod
+    def set_root(cls, calibration_dir):
+        cls.root = os.path.abspath(calibration_dir)
+        cls._open.clear()
+
+    @classmethod
+    def get_root(cls):
+        if cls.root is None:
+            raise Exception('Set CompactCache.set_root(<calibration directory>) to read or write compact caches')
+        return cls.root
+
+    @classmethod
+    def open(cls, manifest):
+        manifest_path = os.path.join(cls.get_root(), manifest)
+        cache = cls._open.pop(manifest_path, None) or cls(manifest_path)
+        cls._open[manifest_path] = cache
+        while len(cls._open) > cls.max_open:
+            cls._open.popitem(last=False)
+        return cache
+
+    @classmethod
+    def clean(cls, cache_dir, keep=()):
+        """
+        Delete the cache files in cache_dir not referenced by the kept iteration states, e.g. after an iteration
+        is finalized: CompactCache.clean('compact_cache', keep=[state.analyzers for state in kept_states])
+        :param cache_dir: directory of the cache files, relative to the calibration directory
+        :param keep: objects holding the compact cache references to keep, e.g. analyzer cache() outputs,
+                     searched recursively through dicts and lists
+        :return: list of deleted files
+        """
+        kept = set()
+
+        def collect(o):
+            if isinstance(o, dict):
+                if 'compact_cache' in o:
+                    kept.add(os.path.normpath(o['compact_cache']))
+                for v in o.values():
+                    collect(v)
+            elif isinstance(o, (list, tuple)):
+                for v in o:
+                    collect(v)
+        collect(keep)
+
+        directory = os.path.join(cls.get_root(), cache_dir)
+        if not os.path.isdir(directory):
+            return []
+
+        deleted = []
+        for filename in sorted(os.listdir(directory)):
+            basename, extension = os.path.splitext(filename)
+            if extension not in ('.json', '.npy') or \
+                    os.path.normpath(os.path.join(cache_dir, basename + '.json')) in kept:
+                continue
+            path = os.path.join(directory, filename)
+            cls._open.pop(os.path.join(directory, basename + '.json'), None)
+            os.remove(path)
+            deleted.append(path)
+        logger.info('Deleted %d unreferenced compact cache files from %s', len(deleted), directory)
+        return deleted
+
+    def sample(self, i):
+        """
+        :return: the sample dict, in the same format as the JSON cache
+        """
+        values = np.asarray(self.values[i])
+        bins, channels = self.manifest['bins'], self.manifest['channels']
+
+        if self.manifest['row_channel']:
+            d = OrderedDict(bins)
+            d[self.manifest['row_channel']] = values.tolist()
+            return d
+
+        keep = ~np.isnan(values).all(axis=1)  # bins missing from this sample
+        d = OrderedDict((k, [x for x, kept in zip(v, keep) if kept]) for k, v in bins.items())
+        for j, channel in enumerate(channels):
+            d[channel] = values[keep, j].tolist()
+        return d
+
+    @classmethod
+    def resolve(cls, data):
+        """
+        Pass-through for JSON cache sample dicts; loads the sample for a compact cache reference
+        """
+        if isinstance(data, dict) and 'compact_cache' in data:
+            return cls.open(data['compact_cache']).sample(data['sample'])
+        return data
@@ -1,22 +1,25 @@
 import itertools
+import os
 import random
+import shutil
+import hashlib
+import threading
 from datetime import date, datetime
 import calendar
 import logging
 from collections import OrderedDict
-# from geopy.distance import vincenty
-import numpy.ma as ma
 import json
 
 import pandas as pd
 import numpy as np
+from scipy.stats import binom, beta
 
 import dtk.utils.parsers.malaria_summary as malaria_summary
 
 logger = logging.getLogger(__name__)
 
 
-def grouped_df(df, pfprdict, index, column_keep, column_del):
+def grouped_df(df, pfprdict, index, column_keep):
     """
     Recut dataframe to recategorize data into desired age and parasitemia bins
 
@@ -27,28 +30,219 @@ def grouped_df(df, pfprdict, index, column_keep, column_del):
 
     index - Multi index into which 'df' is rebinned
 
-    column_keep - Column (e.g. parasitemia) to keep
+    column_keep - Column (e.g. parasitemia) to count; other density columns of 'df' are ignored
+    """
+    dftemp = density_histogram(df, index, [column_keep], pfprdict)
+
+    logger.debug('\n%s', dftemp)
+
+    return dftemp
 
-    column_del - Column (e.g. gametocytemia) to delete
+
+def density_histogram(df, index, columns, pfprdict=None):
+    """
+    Count the rows of df in (Season, Age Bin, PfPR Bin) bins for several density columns in one pass
+    :param df: pandas.DataFrame with a column for each index level but the last, and the density columns
+    :param index: reference MultiIndex of seasons, right-edges of age bins and right-edges of PfPR bins;
+                  each of the columns is binned on the last level
+    :param columns: density columns (e.g. Parasitemia, Gametocytemia) to count
+    :param pfprdict: optional dictionary mapping PfPR bin edges to the density labels of the output
+    :return: pandas.DataFrame of counts, one column per density column, indexed on the seasons observed
+             in the first column by all age and PfPR bins
     """
-    dftemp = df.copy()
-    del dftemp[column_del]
+    plan = get_binning_plan(index)
+    if plan is None:
+        raise Exception('Unable to bin on MultiIndex levels %s' % list(index.names))
 
-    dftemp['PfPR Bin'] = df[column_keep]
-    dftemp = aggregate_on_index(dftemp, index)
+    codes, valid = binning_plan_codes(df, plan[:-1])
+    density_edges = plan[-1][2]
 
-    dfGrouped = dftemp.groupby(['Season', 'Age Bin', 'PfPR Bin'])
+    shape = tuple(len(values) for _, _, values in plan)
+    n_bins = int(np.prod(shape))
+    flat = np.ravel_multi_index(codes, shape[:-1], mode='clip') * shape[-1] if codes else np.zeros(len(df), dtype=np.int64)
 
-    dftemp = dfGrouped[column_keep].count()
-    dftemp = dftemp.unstack().fillna(0).stack()
-    dftemp = dftemp.rename(column_keep).reset_index()
-    dftemp['PfPR Bin'] = [pfprdict[p] for p in dftemp['PfPR Bin']]
+    # all columns in a single bincount, offset by column
+    combined, weights = [], []
+    for i, column in enumerate(columns):
+        density = df[column].values.astype(np.float64)
+        density_code = np.searchsorted(density_edges, density, side='left')  # right-closed, NaN past the end
+        ok = valid & (density_code < shape[-1]) & (density > -np.inf)
+        combined.append(i * n_bins + flat[ok] + density_code[ok])
+    counts = np.bincount(np.concatenate(combined), minlength=len(columns) * n_bins).astype(np.float64)
+    counts = counts.reshape((len(columns), shape[0], -1))
 
-    dftemp = dftemp.set_index(['Season', 'Age Bin', 'PfPR Bin'])
+    # as groupby on the first level: only values with data are kept, then unstacked/filled on the other levels
+    observed = counts[0].sum(axis=1) > 0
+    counts = counts[:, observed, :]
 
-    logger.debug('\n%s', dftemp)
+    levels = [values for _, _, values in plan]
+    levels[0] = levels[0][observed]
+    if pfprdict is not None:
+        levels[-1] = np.array([pfprdict[p] for p in levels[-1]])
+    agg_index = pd.MultiIndex.from_product(levels, names=[name for name, _, _ in plan])
 
-    return dftemp
+    return pd.DataFrame(counts.reshape(len(columns), -1).T, index=agg_index, columns=columns)
+
+
+_village_stores = OrderedDict()
+max_village_stores = 16
+_reference_frames = OrderedDict()
+max_reference_frames = 64
+_reference_lock = threading.Lock()
+
+
+def default_village_store_dir():
+    """
+    :return: per-user cache directory of the village stores: $XDG_CACHE_HOME/dtk-tools-malaria/village_stores,
+             ~/.cache/dtk-tools-malaria/village_stores by default
+    """
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'dtk-tools-malaria', 'village_stores')
+
+
+def village_store_filename(csvfilename, cache_dir=None):
+    """
+    :param cache_dir: directory of the village stores, default default_village_store_dir()
+    :return: village store of the CSV, named after the CSV and a hash of its absolute path
+    """
+    path = os.path.abspath(csvfilename)
+    digest = hashlib.md5(path.encode('utf-8')).hexdigest()[:12]
+    return os.path.join(cache_dir or default_village_store_dir(),
+                        '%s_%s.villages.npz' % (os.path.basename(path), digest))
+
+
+def _write_village_store(filename, df, village_column, mtime):
+    arrays = {'__columns__': np.array(df.columns.tolist(), dtype=str),
+              '__dtypes__': np.array([str(dtype) for dtype in df.dtypes], dtype=str),
+              '__mtime__': np.array([mtime])}
+    villages = []
+    for i, (village, vdf) in enumerate(df.groupby(village_column, sort=True)):
+        villages.append(village)
+        arrays['v%d_index' % i] = vdf.index.values
+        for j, column in enumerate(df.columns):
+            values = vdf[column]
+            if not pd.api.types.is_numeric_dtype(values):
+                if not values.dropna().map(lambda x: isinstance(x, str)).all():
+                    raise ValueError('column %s holds values other than strings' % column)
+                arrays['v%d_c%d_na' % (i, j)] = values.isnull().values
+                arrays['v%d_c%d' % (i, j)] = np.asarray(values.fillna(''), dtype=str)
+            else:
+                arrays['v%d_c%d' % (i, j)] = values.values
+    arrays['__villages__'] = np.array(villages, dtype=str)
+
+    directory = os.path.dirname(filename)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    tmp = '%s.%d.tmp.npz' % (filename[:-len('.npz')], os.getpid())
+    np.savez(tmp, **arrays)
+    os.replace(tmp, filename)
+
+
+def _read_village_store(filename):
+    store = {}
+    with np.load(filename, allow_pickle=False) as f:
+        columns = f['__columns__'].tolist()
+        dtypes = dict(zip(columns, f['__dtypes__'].tolist()))
+        for i, village in enumerate(f['__villages__'].tolist()):
+            data = OrderedDict()
+            for j, column in enumerate(columns):
+                values = f['v%d_c%d' % (i, j)]
+                if 'v%d_c%d_na' % (i, j) in f.files:
+                    values = values.astype(object)
+                    values[f['v%d_c%d_na' % (i, j)]] = np.nan
+                data[column] = values
+            # the dtypes pandas.read_csv gave the columns, so frames do not depend on where they were loaded from
+            store[village] = pd.DataFrame(data, index=f['v%d_index' % i], columns=columns).astype(dtypes)
+    return store
+
+
+def read_village_csv(csvfilename, village_column='Village', cache_dir=None):
+    """
+    Parse a reference CSV once per process into frames by village. The partitioned columns are also
+    stored in a user cache directory (.villages.npz) for other processes, and rebuilt when the CSV modification time
+    changes. Frames have the pandas.read_csv dtypes, whether parsed or loaded from the store.
+    :param csvfilename: reference CSV with a village column
+    :param village_column: name of the village column
+    :param cache_dir: directory of the village stores, default default_village_store_dir()
+    :return: dict of village -> pandas.DataFrame, shared by all callers and not to be modified
+    """
+    mtime = os.path.getmtime(csvfilename)
+    key = (os.path.abspath(csvfilename), mtime, village_column)
+
+    with _reference_lock:
+        if key in _village_stores:
+            _village_stores.move_to_end(key)
+            return _village_stores[key]
+
+        store = None
+        filename = village_store_filename(csvfilename, cache_dir)
+        if os.path.exists(filename):
+            try:
+                with np.load(filename, allow_pickle=False) as f:
+                    stale = f['__mtime__'][0] != mtime
+                if not stale:
+                    store = _read_village_store(filename)
+            except (IOError, OSError, KeyError, ValueError) as e:
+                logger.warning('Ignoring unreadable village store %s: %s', filename, e)
+
+        if store is None:
+            df = pd.read_csv(csvfilename)
+            store = {village: vdf for village, vdf in df.groupby(village_column, sort=True)}
+            try:
+                _write_village_store(filename, df, village_column, mtime)
+            except (IOError, OSError, ValueError) as e:
+                logger.warning('Unable to write village store %s: %s', filename, e)
+
+        # drop the frames parsed from an older version of this file, then the least recently used
+        for stale_key in [k for k in _village_stores if k[0] == key[0] and k[1] != mtime]:
+            del _village_stores[stale_key]
+        _village_stores[key] = store
+        while len(_village_stores) > max_village_stores:
+            _village_stores.popitem(last=False)
+        return store
+
+
+def village_reference_rows(csvfilename, villages, village_column='Village', cache_dir=None):
+    """
+    :param csvfilename: reference CSV with a village column
+    :param villages: a village name or list of village names
+    :param cache_dir: directory of the village stores, default default_village_store_dir()
+    :return: a new pandas.DataFrame of the CSV rows for the villages, in file order
+    """
+    store = read_village_csv(csvfilename, village_column, cache_dir)
+    villages = [villages] if isinstance(villages, str) else villages
+    frames = [store[v] for v in villages if v in store]
+    if not frames:
+        return next(iter(store.values())).iloc[0:0].copy() if store else pd.DataFrame()
+    return pd.concat(frames).sort_index() if len(frames) > 1 else frames[0].copy()
+
+
+def memoize_reference(csvfilename, key, build):
+    """
+    Memoize a reference table built from a CSV, keyed on the CSV path, its modification time and key
+    :param build: function returning the pandas object to cache
+    :return: a copy of the cached pandas object
+    """
+    full_key = (os.path.abspath(csvfilename), os.path.getmtime(csvfilename), key)
+    with _reference_lock:
+        cached = _reference_frames.get(full_key)
+        if cached is not None:
+            _reference_frames.move_to_end(full_key)
+    if cached is None:
+        cached = build()
+        with _reference_lock:
+            _reference_frames[full_key] = cached
+            while len(_reference_frames) > max_reference_frames:
+                _reference_frames.popitem(last=False)
+    return cached.copy()
+
+
+def _hashable(value):
+    if isinstance(value, dict):
+        return tuple(sorted((k, _hashable(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return tuple(_hashable(v) for v in value)
+    return value
 
 
 def season_channel_age_density_csv_to_pandas(csvfilename, metadata):
@@ -80,8 +274,13 @@ def season_channel_age_density_csv_to_pandas(csvfilename, metadata):
       ...
 
     """
-    df = pd.read_csv(csvfilename)
-    df = df.loc[df['Village'] == metadata['village']]
+    key = ('season_channel_age_density', _hashable(metadata['village']), _hashable(metadata['seasons']),
+           _hashable(metadata['age_bins']), _hashable(metadata['parasitemia_bins']))
+    return memoize_reference(csvfilename, key, lambda: _season_channel_age_density(csvfilename, metadata))
+
+
+def _season_channel_age_density(csvfilename, metadata):
+    df = village_reference_rows(csvfilename, metadata['village'])
 
     pfprBinsDensity = metadata['parasitemia_bins']
     uL_per_field = 0.5 / 200.0  # from Garki PDF - page 111 - 0.5 uL per 200 views
@@ -100,16 +299,10 @@ def season_channel_age_density_csv_to_pandas(csvfilename, metadata):
     df = df.loc[df['Seasons'].isin(seasons)]
     df = df.rename(columns={'Seasons': 'Season', 'Age': 'Age Bin'})
 
-    df2 = grouped_df(df, pfprdict, index, 'Parasitemia', 'Gametocytemia')
-    df3 = grouped_df(df, pfprdict, index, 'Gametocytemia', 'Parasitemia')
-    dfJoined = df2.join(df3).fillna(0)
-    dfJoined = pd.concat([dfJoined['Gametocytemia'], dfJoined['Parasitemia']])
-    dfJoined.name = 'Counts'
-    dftemp = dfJoined.reset_index()
-    dftemp['Channel'] = 'PfPR by Gametocytemia and Age Bin'
-    dftemp.loc[len(dftemp)/2:, 'Channel'] = 'PfPR by Parasitemia and Age Bin'
-    dftemp = dftemp.rename(columns={'Seasons': 'Season', 'PfPR Bins': 'PfPR Bin', 'Age Bins': 'Age Bin'})
-    dftemp = dftemp.set_index(['Channel', 'Season', 'Age Bin', 'PfPR Bin'])
+    counts = density_histogram(df, index, ['Parasitemia', 'Gametocytemia'], pfprdict)
+    dftemp = pd.concat([counts['Gametocytemia'], counts['Parasitemia']],
+                       keys=['PfPR by Gametocytemia and Age Bin', 'PfPR by Parasitemia and Age Bin'],
+                       names=['Channel']).rename('Counts').to_frame()
 
     logger.debug('\n%s', dftemp)
 
@@ -190,6 +383,17 @@ def channel_age_json_to_pandas(reference, index_key='Age Bin'):
     return reference_df
 
 
+def index_level_codes(index):
+    """
+    :param index: pandas.Index or MultiIndex
+    :return: (level names, level values, per-row integer codes into the level values) for each level
+    """
+    if isinstance(index, pd.MultiIndex):
+        return list(index.names), list(index.levels), [np.asarray(c) for c in index.codes]
+    codes, uniques = pd.factorize(index, sort=True)
+    return [index.name], [pd.Index(uniques, name=index.name)], [codes]
+
+
 def convert_annualized(s, reporting_interval=None, start_day=None):
     """
     Use Time index level to revert annualized rate channels,
@@ -201,9 +405,9 @@ def convert_annualized(s, reporting_interval=None, start_day=None):
     :return: pandas.Series normalized to Reporting Interval as a fraction of the year
     """
 
-    s_ix = s.index
-    time_ix = s_ix.names.index('Time')
-    time_levels = s_ix.levels[time_ix].values
+    names, levels, codes = index_level_codes(s.index)
+    time_ix = names.index('Time')
+    time_levels = levels[time_ix].values
 
     start_time = (start_day - 1) if start_day else 0  # metadata reported at end of first time step
 
@@ -214,10 +418,9 @@ def convert_annualized(s, reporting_interval=None, start_day=None):
     if len(time_intervals) > 2 and np.abs(time_intervals[0] - time_intervals[1]) > 1:
         raise Exception('Time differences between reports differ by more than integer rounding.')
 
-    intervals_by_time = dict(zip(time_levels, time_intervals))
-    df = s.reset_index()
-    df[s.name] *= df.Time.apply(lambda x: intervals_by_time[x] / 365.0)
-    return df.set_index(s_ix.names)
+    # broadcast the interval of each Time level value through the level codes
+    fraction_of_year = np.append(time_intervals / 365.0, np.nan)[codes[time_ix]]  # code -1 (missing Time) -> NaN
+    return pd.DataFrame({s.name: s.values * fraction_of_year}, index=s.index)
 
 
 def convert_to_counts(rates, pops):
@@ -227,27 +430,71 @@ def convert_to_counts(rates, pops):
     :param pops: a pandas.Series of average population counts
     :return: a pandas.Series (same binning as rates)
     """
-    rate_idx = rates.index.names
-    pop_idx = pops.index.names
+    rate_names, rate_levels, rate_codes = index_level_codes(rates.index)
+    pop_names, pop_levels, pop_codes = index_level_codes(pops.index)
 
-    # Join rates to population counts on the binning of the latter
-    df = rates.reset_index().set_index(pop_idx)\
-              .join(pops, how='left')\
-              .reset_index().set_index(rate_idx)
+    # Position of each population count in the product of its index levels
+    shape = tuple(len(level) for level in pop_levels)
+    pop_valid = np.logical_and.reduce([c >= 0 for c in pop_codes])
+    lookup = np.full(int(np.prod(shape)), -1, dtype=np.int64)
+    lookup[np.ravel_multi_index([c[pop_valid] for c in pop_codes], shape)] = np.flatnonzero(pop_valid)
 
-    counts = (df[rates.name] * df[pops.name]).rename(rates.name)
-    return counts
+    # Translate the rates codes of each population level into population level codes
+    valid = np.ones(len(rates), dtype=bool)
+    codes = []
+    for name, level in zip(pop_names, pop_levels):
+        i = rate_names.index(name)
+        translate = np.append(level.get_indexer(rate_levels[i]), -1)  # code -1 (missing) -> -1
+        code = translate[rate_codes[i]]
+        valid &= code >= 0
+        codes.append(code)
+
+    position = np.full(len(rates), -1, dtype=np.int64)
+    position[valid] = lookup[np.ravel_multi_index([c[valid] for c in codes], shape)]
+
+    # Left join of the rates on the population binning: missing populations give NaN counts
+    pop_values = np.append(pops.values.astype(np.float64), np.nan)[position]
+    return pd.Series(rates.values * pop_values, index=rates.index, name=rates.name)
 
 
 def age_from_birth_cohort(df):
     """
     Reinterpret 'Time' as 'Age Bin' for a birth cohort
     :param df: a pandas.DataFrame of counts and 'Time' in days
-    :return: a pandas.DataFrame including an additional (or overwritten) 'Age Bin' column
+    :return: a new pandas.DataFrame including an additional (or overwritten) 'Age Bin' column
     """
 
-    df['Age Bin'] = df['Time'] / 365.0   # Time in days but Age in years
-    return df
+    return df.assign(**{'Age Bin': df['Time'] / 365.0})   # Time in days but Age in years
+
+
+_months_by_day_of_year = {}
+
+
+def month_by_day_of_year(leap_year=False):
+    """
+    Lookup table from day of year to month number
+    :param leap_year: use the 366-day calendar
+    :return: read-only integer array; entry d is the month (1-12) of day of year d (1-365, or 1-366), entry 0 is 0
+    """
+    if leap_year not in _months_by_day_of_year:
+        year = 2000 if leap_year else 2001
+        days = 366 if leap_year else 365
+        lookup = np.zeros(days + 1, dtype=np.int64)
+        first_day = date(year, 1, 1).toordinal()
+        lookup[1:] = [date.fromordinal(first_day + d).month for d in range(days)]
+        lookup.flags.writeable = False
+        _months_by_day_of_year[leap_year] = lookup
+    return _months_by_day_of_year[leap_year]
+
+
+def month_from_day_of_year(day_of_year, leap_year=False):
+    """
+    Vectorized month number from day of year
+    :param day_of_year: array-like of days of year, starting at 1
+    :param leap_year: use the 366-day calendar
+    :return: numpy array of month numbers (1-12)
+    """
+    return month_by_day_of_year(leap_year)[np.asarray(day_of_year, dtype=np.int64)]
 
 
 def season_from_time(df, seasons=None):
@@ -255,21 +502,24 @@ def season_from_time(df, seasons=None):
     Reinterpret 'Time' as 'Month' or 'Season' for seasonal data
     :param df: a pandas.DataFrame of counts and 'Time' in days
     :param seasons: optional dictionary of month names to season names
-    :return: a pandas.DataFrame including an additional 'Season' or 'Month' column
+    :return: a new pandas.DataFrame including an additional 'Season' or 'Month' column
     """
 
-    # Day of Year from Time (in days)
-    day_of_year = 1 + df['Time'] % 365
+    # Day of Year from Time (in days), on the 365-day years of the simulation clock
+    day_of_year = 1 + np.asarray(df['Time'], dtype=np.int64) % 365
 
-    # Assign each Day of Year to a named Month
-    month = day_of_year.apply(lambda x: calendar.month_name[date.fromordinal(x).month])
+    # Assign each Day of Year to a named Month (or Season) by table lookup
+    month_names = np.array(calendar.month_name, dtype=object)  # index 0 is ''
+    lookup = month_names[month_by_day_of_year()]
 
     # Return season if optional lookup is available, otherwise return month
     if seasons:
-        df['Season'] = month.apply(lambda x: seasons.get(x))
-        df.dropna(subset=['Season'], inplace=True)
+        lookup = np.array([seasons.get(x) for x in lookup], dtype=object)
+        season = lookup[day_of_year]
+        df = df.assign(Season=season)
+        df = df.dropna(subset=['Season'])
     else:
-        df['Month'] = month
+        df = df.assign(Month=lookup[day_of_year])
 
     return df
 
@@ -281,6 +531,112 @@ def pairwise(iterable):
     return itertools.izip(a, b)
 
 
+max_binning_plans = 64
+_binning_plans = {}
+
+
+def get_binning_plan(index):
+    """
+    Per-level binning of a reference (Multi)Index, cached on the index object so that
+    repeated aggregation of many simulations onto the same reference skips all setup
+    :param index: pandas.(Multi)Index of categorical values or right-bin-edges
+    :return: list of (level name, 'categorical' or 'bins', level values) or None if a level has another dtype
+    """
+    key = id(index)
+    cached = _binning_plans.get(key)
+    if cached is not None and cached[0] is index:  # holding the index keeps its id from being reused
+        return cached[1]
+
+    levels = index.levels if isinstance(index, pd.MultiIndex) else [index]
+
+    plan = []
+    for ix in levels:
+        if ix.dtype == 'object' or pd.api.types.is_string_dtype(ix.dtype):
+            plan.append((ix.name, 'categorical', pd.Index(ix.unique()).sort_values()))
+        elif ix.dtype in ['int64', 'float64']:
+            if not ix.is_monotonic_increasing or not ix.is_unique:
+                plan = None  # left to pd.cut to complain about
+                break
+            plan.append((ix.name, 'bins', ix.values))
+        else:
+            plan = None
+            break
+
+    if len(_binning_plans) >= max_binning_plans:
+        _binning_plans.clear()
+    _binning_plans[key] = (index, plan)
+
+    return plan
+
+
+def binning_plan_codes(df, plan):
+    """
+    :param df: a pandas.DataFrame with columns matching the plan level names
+    :param plan: binning plan from get_binning_plan
+    :return: (list of per-level bin codes for each row of df, boolean mask of rows falling in the reference bins)
+    """
+    for name, _, _ in plan:
+        if name not in df.columns:
+            raise Exception('Cannot perform aggregation as MultiIndex level (%s) not found in DataFrame:\n%s' % (name, df.head()))
+
+    valid = np.ones(len(df), dtype=bool)
+    codes = []
+    for name, kind, values in plan:
+        col = df[name].values
+        if kind == 'categorical':
+            # Keep values present in reference index-level values; drop any that are not
+            code = values.get_indexer(col)
+            valid &= code >= 0
+        else:
+            # Right-closed bins (-inf, e0], (e0, e1], ... labelled with their upper edges, as pd.cut
+            col = col.astype(np.float64)
+            code = np.searchsorted(values, col, side='left')
+            valid &= (code < len(values)) & (col > -np.inf)  # NaN sorts past the last edge
+        codes.append(code)
+
+    return codes, valid
+
+
+def aggregate_with_binning_plan(df, plan, keep):
+    """
+    Sum the keep columns of df within the reference bins of a binning plan
+    :param df: a pandas.DataFrame with columns matching the plan level names
+    :param plan: binning plan from get_binning_plan
+    :param keep: list of columns to sum
+    :return: pandas.DataFrame of the keep columns indexed on the reference bins, in sorted order, as
+             groupby on pd.cut categoricals: every bin of a numeric level (zero when empty),
+             the observed values of a categorical level
+    """
+    codes, valid = binning_plan_codes(df, plan)
+    codes = [code[valid] for code in codes]
+
+    shape = tuple(len(values) for _, _, values in plan)
+    flat = np.ravel_multi_index(codes, shape)
+    n_bins = int(np.prod(shape))
+
+    level_codes = [np.arange(len(values)) if kind == 'bins' else np.unique(code)
+                   for (_, kind, values), code in zip(plan, codes)]
+    bin_codes = [c.ravel() for c in np.meshgrid(*level_codes, indexing='ij')]
+    bins = np.ravel_multi_index(bin_codes, shape)
+
+    sums = {}
+    for column in keep:
+        values = df[column].values[valid].astype(np.float64)
+        values[np.isnan(values)] = 0  # NaN counts as zero in a sum, as in groupby().sum()
+        summed = np.bincount(flat, weights=values, minlength=n_bins)[bins]
+        dtype = df[column].values.dtype
+        sums[column] = summed.astype(dtype if np.issubdtype(dtype, np.integer) else np.float64)  # float if empty
+
+    if len(plan) == 1:
+        name, _, values = plan[0]
+        agg_index = pd.Index(values[bin_codes[0]], name=name)
+    else:
+        agg_index = pd.MultiIndex.from_arrays([values[code] for (_, _, values), code in zip(plan, bin_codes)],
+                                              names=[name for name, _, _ in plan])
+
+    return pd.DataFrame(sums, index=agg_index, columns=keep)
+
+
 def aggregate_on_index(df, index, keep=slice(None)):
     """
     Aggregate and re-index data on specified (multi-)index (levels and) intervals
@@ -290,6 +646,13 @@ def aggregate_on_index(df, index, keep=slice(None)):
     :return: pandas.Series or DataFrame of specified channels aggregated and indexed on the specified binning
     """
 
+    if keep != slice(None):
+        plan = get_binning_plan(index)
+        if plan is not None:
+            df = aggregate_with_binning_plan(df, plan, keep)
+            logger.debug('Data aggregated/joined on MultiIndex levels:\n%s', df.head(15))
+            return df
+
     if isinstance(index, pd.MultiIndex):
         levels = index.levels
     else:
@@ -321,7 +684,7 @@ def aggregate_on_index(df, index, keep=slice(None)):
             #     else:
             #         labels.append("{0} - {1}".format(low, high))
 
-            df[ix.name] = pd.cut(df[ix.name], bin_edges, labels=labels)
+            df = df.assign(**{ix.name: pd.cut(df[ix.name], bin_edges, labels=labels)})  # leave input df intact
 
         else:
             logger.warning('Unexpected dtype=%s for MultiIndex level (%s). No aggregation performed.', ix.dtype, ix.name)
@@ -333,6 +696,99 @@ def aggregate_on_index(df, index, keep=slice(None)):
     return df
 
 
+vector_stats_columns = ['Time', 'NodeID', 'Species', 'Population', 'VectorPopulation']
+vector_stats_dtypes = {'Time': np.float64, 'NodeID': np.int64, 'Species': str,
+                       'Population': np.float64, 'VectorPopulation': np.float64}
+
+
+def iter_vector_stats(source, burn_in_days=0, chunksize=500000):
+    """
+    :param source: path of a ReportVectorStats.csv, or the pandas.DataFrame already parsed from it
+    :param burn_in_days: rows with Time before this are dropped
+    :param chunksize: number of rows per chunk
+    :return: generator of pandas.DataFrame chunks of the vector_stats_columns, without burn-in rows
+    """
+    if isinstance(source, pd.DataFrame):
+        time = source['Time'].values
+        start = np.searchsorted(time, burn_in_days, side='left') if source['Time'].is_monotonic_increasing else 0
+        chunks = (source.iloc[i:i + chunksize] for i in range(start, len(source), chunksize))
+    else:
+        # burn-in rows are dropped chunk by chunk, so at most one chunk of them is in memory at a time
+        chunks = pd.read_csv(source, usecols=vector_stats_columns, dtype=vector_stats_dtypes, skipinitialspace=True,
+                             chunksize=chunksize)
+
+    for chunk in chunks:
+        if burn_in_days:
+            chunk = chunk[chunk['Time'].values >= burn_in_days]
+            if chunk.empty:
+                continue
+        yield chunk
+
+
+def vector_stats_by_month(source, burn_in_days=0, chunksize=500000):
+    """
+    Vectors per human by month, node and species from ReportVectorStats: the mean over days of the month
+    of the daily mean over rows, as a chunked pass so that memory is bounded by the number of
+    (day of year, node, species) bins rather than by the length of the report
+    :param source: path of a ReportVectorStats.csv, or the pandas.DataFrame already parsed from it
+    :param burn_in_days: rows with Time before this are dropped
+    :param chunksize: number of rows per chunk
+    :return: pandas.DataFrame with Month, NodeID, Species and Vector_per_Human columns sorted by Species, Month, NodeID
+    """
+    nodes, species = pd.Index([], dtype=np.int64), pd.Index([], dtype=object)
+    shape = (365, 0, 0)
+    sums, counts, rows = np.zeros(shape), np.zeros(shape, dtype=np.int64), np.zeros(shape, dtype=np.int64)
+
+    for chunk in iter_vector_stats(source, burn_in_days, chunksize):
+        chunk_nodes, chunk_species = chunk['NodeID'].values, chunk['Species'].values.astype(object)
+
+        new_nodes = nodes.union(pd.unique(chunk_nodes))
+        new_species = species.union(pd.unique(chunk_species))
+        if len(new_nodes) != len(nodes) or len(new_species) != len(species):
+            new_shape = (365, len(new_nodes), len(new_species))
+            ix = np.ix_(np.arange(365), new_nodes.get_indexer(nodes), new_species.get_indexer(species))
+            grown = [np.zeros(new_shape, dtype=a.dtype) for a in (sums, counts, rows)]
+            for g, a in zip(grown, (sums, counts, rows)):
+                g[ix] = a
+            sums, counts, rows = grown
+            nodes, species, shape = new_nodes, new_species, new_shape
+
+        day = ((chunk['Time'].values + 1) % 365).astype(np.int64)
+        flat = np.ravel_multi_index((day, nodes.get_indexer(chunk_nodes), species.get_indexer(chunk_species)), shape)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = chunk['VectorPopulation'].values.astype(np.float64) / chunk['Population'].values
+        observed = ~np.isnan(ratio)  # as np.mean on a Series, missing values are skipped
+
+        sums += np.bincount(flat[observed], weights=ratio[observed], minlength=sums.size).reshape(shape)
+        counts += np.bincount(flat[observed], minlength=counts.size).reshape(shape)
+        rows += np.bincount(flat, minlength=rows.size).reshape(shape)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        daily = sums / counts
+    daily_observed = counts > 0
+
+    # mean of the daily means within each month
+    month = month_from_day_of_year(np.arange(1, 366))
+    monthly_sums, monthly_counts = np.zeros((13,) + shape[1:]), np.zeros((13,) + shape[1:])
+    np.add.at(monthly_sums, month, np.where(daily_observed, daily, 0))
+    np.add.at(monthly_counts, month, daily_observed)
+    monthly_rows = np.zeros((13,) + shape[1:], dtype=bool)
+    np.logical_or.at(monthly_rows, month, rows > 0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        monthly = monthly_sums / monthly_counts
+
+    # (species, month, node) order of nonzero on sorted nodes and species gives the sorted output
+    node_order, species_order = nodes.argsort(), species.argsort()
+    s_ix, m_ix, n_ix = np.nonzero(monthly_rows[:, node_order][:, :, species_order].transpose(2, 0, 1))
+    n_ix, s_ix = node_order[n_ix], species_order[s_ix]
+    return pd.DataFrame({'Month': m_ix,
+                         'NodeID': nodes.values[n_ix],
+                         'Species': species.values[s_ix],
+                         'Vector_per_Human': monthly[m_ix, n_ix, s_ix]})
+
+
 def aggregate_on_month(sim, ref):
     months = list(ref['Month'].unique())
     sim = sim[sim['Month'].isin(months)]
@@ -340,49 +796,272 @@ def aggregate_on_month(sim, ref):
     return sim
 
 
+max_error_bars = 256
+_error_bars = OrderedDict()
+
+
+def binomial_error_bars(trials, observations, confidence=0.68, method='binom'):
+    """
+    Binomial confidence intervals on Observations / Trials as unsigned offsets, for pyplot.errorbar
+    :param trials: array-like of trials, any shape, e.g. (bins,) or (samples, bins)
+    :param observations: array-like of observations, same shape as trials
+    :param confidence: confidence level, default 68% (1-sigma)
+    :param method: 'binom' (quantiles of the binomial at the observed rate), 'clopper-pearson' or 'jeffreys'
+    :return: array shaped (2,) + trials.shape of lower and upper offsets relative to observations / trials
+    """
+    n = np.asarray(trials, dtype=np.float64)
+    k = np.asarray(observations, dtype=np.float64)
+
+    key = (method, confidence, n.shape, n.tobytes(), k.tobytes())
+    cached = _error_bars.get(key)
+    if cached is not None:
+        _error_bars.move_to_end(key)
+        return cached
+
+    alpha = 1 - confidence
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p = k / n
+        if method == 'binom':
+            lower, upper = binom.interval(confidence, n, p)
+            lower, upper = lower / n, upper / n
+        elif method == 'clopper-pearson':
+            lower = np.where(k > 0, beta.ppf(alpha / 2, k, n - k + 1), 0)
+            upper = np.where(k < n, beta.ppf(1 - alpha / 2, k + 1, n - k), 1)
+        elif method == 'jeffreys':
+            lower = np.where(k > 0, beta.ppf(alpha / 2, k + 0.5, n - k + 0.5), 0)
+            upper = np.where(k < n, beta.ppf(1 - alpha / 2, k + 0.5, n - k + 0.5), 1)
+        else:
+            raise Exception('Unknown binomial interval method: %s' % method)
+
+    errs = np.abs(np.array([lower - p, upper - p]))
+    errs.flags.writeable = False
+
+    if len(_error_bars) >= max_error_bars:
+        _error_bars.popitem(last=False)
+    _error_bars[key] = errs
+
+    return errs
+
+
 def get_spatial_report_data_at_date(sp_data, date):
 
     return pd.DataFrame({'node': sp_data['nodeids'],
                          'data': sp_data['data'][date]})
 
 
-def get_risk_by_distance(df_sim, distances, ddf):
+class DistanceRingIndex(object):
+    """
+    Sparse neighbor index of a pairwise distance matrix, bucketed by distance ring.
+    Built once per site and reused for every simulation analyzed against it.
+
+    Ring k holds the (node1, node2) pairs with distances[k-1] < dist <= distances[k], node1 != node2,
+    evaluated on the full-precision distances. Each ring is a binary CSR adjacency matrix over the sorted unique
+    node IDs, with all rings stored in two flat arrays so that a memory-mapped index is used without copying:
+    - node_ids: node ID of each row/column
+    - ring_indptr: (rings x nodes + 1) CSR row pointers of each ring into ring_indices
+    - ring_indices: column positions of the neighbors of each row, ring after ring
+    """
 
-    nodelist = df_sim['node'].values.tolist()
-    rel_risk = []
+    array_names = ['node_ids', 'ring_indptr', 'ring_indices']
+    format_version = 2
+
+    def __init__(self, node_ids, ring_indptr, ring_indices, distances):
+        self.node_ids = node_ids
+        self.ring_indptr = ring_indptr
+        self.ring_indices = ring_indices
+        self.distances = list(distances)
+
+    @classmethod
+    def from_frame(cls, ddf, distances):
+        """
+        :param ddf: a pandas.DataFrame of pairwise distances with columns 'node1', 'node2', 'dist'
+        :param distances: list of outer ring edges, e.g. [0, 0.05, 0.2]
+        :return: a DistanceRingIndex
+        """
+        node1, node2, dist = ddf['node1'].values, ddf['node2'].values, ddf['dist'].values
+        node_ids = np.unique(np.concatenate([node1, node2]))
+
+        not_self = node1 != node2
+        node1, node2, dist = node1[not_self], node2[not_self], dist[not_self]
+        in_ring = np.column_stack([(dist <= n_dist) & (dist > distances[k-1]) for k, n_dist in enumerate(distances)]) \
+            if distances else np.zeros((len(dist), 0), dtype=bool)
+        keep = in_ring.any(axis=1)
+        rows = np.searchsorted(node_ids, node1[keep])
+        cols = np.searchsorted(node_ids, node2[keep])
+        in_ring = in_ring[keep]
+
+        # Sort by (row, col) and merge duplicate pairs: a pair counts once per ring
+        order = np.lexsort((cols, rows))
+        rows, cols, in_ring = rows[order], cols[order], in_ring[order]
+        first = np.ones(len(rows), dtype=bool)
+        first[1:] = (np.diff(rows) != 0) | (np.diff(cols) != 0)
+        starts = np.flatnonzero(first)
+        if len(starts):
+            in_ring = np.logical_or.reduceat(in_ring, starts, axis=0)
+        rows, cols = rows[starts], cols[starts]
+
+        n = len(node_ids)
+        ring_indptr = np.zeros((len(distances), n + 1), dtype=np.int64)
+        offset = 0
+        for k in range(len(distances)):
+            mask = in_ring[:, k]
+            ring_indptr[k] = offset + np.concatenate(([0], np.cumsum(np.bincount(rows[mask], minlength=n))))
+            offset = ring_indptr[k, -1]
+        ring_indices = np.concatenate([np.zeros(0, dtype=np.int32)] +
+                                      [cols[in_ring[:, k]].astype(np.int32) for k in range(len(distances))])
+
+        return cls(node_ids, ring_indptr, ring_indices, distances)
+
+    def ring_sums(self, k, values):
+        """
+        Sum of values over the neighbors of each node in ring k, i.e. the product of the ring adjacency matrix
+        with values, read from slices of the (possibly memory-mapped) index arrays
+        :param k: ring number
+        :param values: array of one value per node of the index
+        :return: array of sums, one per node of the index
+        """
+        indptr = self.ring_indptr[k]
+        start, stop = indptr[0], indptr[-1]
+        sums = np.zeros(len(self.node_ids))
+        if stop > start:
+            neighbors = np.asarray(values)[self.ring_indices[start:stop]]
+            nonempty = np.flatnonzero(np.diff(indptr))
+            sums[nonempty] = np.add.reduceat(neighbors, indptr[nonempty] - start)
+        return sums
+
+    def save(self, path, **meta):
+        """
+        Write the index arrays as .npy files in directory 'path', alongside a meta.json manifest
+        :param path: cache directory
+        :param meta: additional JSON-serializable entries for the manifest, e.g. a source checksum
+        """
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        for name in self.array_names:
+            np.save(os.path.join(path, name + '.npy'), getattr(self, name))
+        meta['distances'] = self.distances
+        meta['format'] = self.format_version
+        with open(os.path.join(path, 'meta.json'), 'w') as fout:
+            json.dump(meta, fout)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Memory-map an index written by save()
+        :param path: cache directory
+        :return: a DistanceRingIndex
+        """
+        with open(os.path.join(path, 'meta.json')) as fin:
+            meta = json.load(fin)
+        arrays = [np.load(os.path.join(path, name + '.npy'), mmap_mode='r') for name in cls.array_names]
+        return cls(*arrays, distances=meta['distances'])
+
+    def risk_by_distance(self, df_sim):
+        """
+        Fraction of people positive in each distance ring around households with at least one positive
+        :param df_sim: a pandas.DataFrame with columns 'node', 'pos', 'pop'
+        :return: list of positive fractions, one per distance ring
+        """
+        nodes = df_sim['node'].values
+        pos = df_sim['pos'].values.astype(float)
+        pop = df_sim['pop'].values.astype(float)
+
+        # Position of each household in the index; households missing from the distance matrix have no neighbors
+        ix = np.searchsorted(self.node_ids, nodes)
+        in_index = ix < len(self.node_ids)
+        in_index[in_index] = self.node_ids[ix[in_index]] == nodes[in_index]
+        ix = ix[in_index]
+        pos_by_node = np.bincount(ix, weights=pos[in_index], minlength=len(self.node_ids))
+        pop_by_node = np.bincount(ix, weights=pop[in_index], minlength=len(self.node_ids))
+
+        has_pos = ~(pos < 1)
+
+        rel_risk = []
+        for k, n_dist in enumerate(self.distances):
+            num_pos = np.zeros(len(nodes))
+            num_ppl = np.zeros(len(nodes))
+            num_pos[in_index] = self.ring_sums(k, pos_by_node)[ix]
+            num_ppl[in_index] = self.ring_sums(k, pop_by_node)[ix]
+
+            # Within-household ring: other household members of each positive
+            if n_dist == 0:
+                within_hh = pop > 1
+                num_pos[within_hh] = ((pos - 1) * pos)[within_hh]
+                num_ppl[within_hh] = ((pop - 1) * pos)[within_hh]
+
+            pos_w_pos = num_pos[has_pos].sum()
+            tot_w_pos = num_ppl[has_pos].sum()
+            rel_risk.append(pos_w_pos / tot_w_pos if tot_w_pos > 0 else 0)
+
+        return rel_risk
 
-    for k, n_dist in enumerate(distances):
-        pos_w_pos = 0.
-        tot_w_pos = 0.
 
-        for hh_num in df_sim.index:
-            if df_sim.ix[hh_num, 'pos'] < 1:
-                continue
+def get_risk_by_distance(df_sim, distances, ddf):
+    """
+    Fraction of people positive by distance ring around households with at least one positive
+    :param df_sim: a pandas.DataFrame with columns 'node', 'pos', 'pop'
+    :param distances: list of outer ring edges, e.g. [0, 0.05, 0.2]
+    :param ddf: a DistanceRingIndex or a pandas.DataFrame of pairwise distances ('node1', 'node2', 'dist')
+    :return: list of positive fractions, one per distance ring
+    """
 
-            if n_dist == 0 and df_sim.ix[hh_num, 'pop'] > 1:
-                hh_pos = df_sim.ix[hh_num, 'pos']
-                hh_tot = df_sim.ix[hh_num, 'pop']
-                num_pos = (hh_pos - 1)*hh_pos
-                num_ppl = (hh_tot - 1)*hh_pos
+    if not isinstance(ddf, DistanceRingIndex):
+        ddf = DistanceRingIndex.from_frame(ddf, distances)
+    elif ddf.distances != list(distances):
+        raise Exception('DistanceRingIndex built for distances %s, not %s' % (ddf.distances, list(distances)))
 
-            else:
-                # node IDs of nodes within distance
-                neighbors = ddf[(ddf['node1'] == nodelist[hh_num]) & (ddf['node2'] != nodelist[hh_num]) &
-                                (ddf['dist'] <= n_dist) & (ddf['dist'] > distances[k-1])]['node2'].values
+    return ddf.risk_by_distance(df_sim)
 
-                ndf = df_sim[df_sim['node'].isin(neighbors)]
-                num_pos = sum(ndf['pos'].values)
-                num_ppl = sum(ndf['pop'].values)
 
-            pos_w_pos += num_pos
-            tot_w_pos += num_ppl
+def file_checksum(filename, blocksize=2**20):
+    """ MD5 hex digest of a file's contents """
+    md5 = hashlib.md5()
+    with open(filename, 'rb') as fin:
+        for block in iter(lambda: fin.read(blocksize), b''):
+            md5.update(block)
+    return md5.hexdigest()
 
-        if tot_w_pos > 0:
-            rel_risk.append(pos_w_pos/tot_w_pos)
-        else:
-            rel_risk.append(0)
 
-    return rel_risk
+def load_distance_ring_index(csvfilename, distances):
+    """
+    Load the DistanceRingIndex of a pairwise distance csv ('node1', 'node2', 'dist'), caching it on disk.
+
+    The index is stored in a '<csvfilename>.ringindex' directory next to the csv and memory-mapped on later loads,
+    so that calibration iterations and worker processes share it rather than re-parsing the csv.
+    The cache is rebuilt when the index format, the ring distances or the csv checksum change; the csv size and modification time
+    are recorded to skip the checksum when the file is untouched.
+    :param csvfilename: path to the pairwise distance csv
+    :param distances: list of outer ring edges, e.g. [0, 0.05, 0.2]
+    :return: a DistanceRingIndex
+    """
+    cache_dir = csvfilename + '.ringindex'
+    stat = os.stat(csvfilename)
+
+    try:
+        with open(os.path.join(cache_dir, 'meta.json')) as fin:
+            meta = json.load(fin)
+        if meta.get('format') == DistanceRingIndex.format_version and meta['distances'] == list(distances):
+            if (meta['size'], meta['mtime']) == (stat.st_size, stat.st_mtime) \
+                    or meta['checksum'] == file_checksum(csvfilename):
+                return DistanceRingIndex.load(cache_dir)
+    except (IOError, ValueError, KeyError):
+        pass  # no usable cache
+
+    logger.info('Building distance ring index for %s', csvfilename)
+    index = DistanceRingIndex.from_frame(pd.read_csv(csvfilename), distances)
+
+    # Write to a temporary directory and move into place, so that concurrent workers never read a partial cache
+    tmp_dir = '%s.%d.tmp' % (cache_dir, os.getpid())
+    try:
+        index.save(tmp_dir, checksum=file_checksum(csvfilename), size=stat.st_size, mtime=stat.st_mtime)
+        if os.path.isdir(cache_dir):
+            shutil.rmtree(cache_dir, ignore_errors=True)
+        os.rename(tmp_dir, cache_dir)
+    except OSError as e:
+        logger.warning('Unable to cache distance ring index for %s: %s', csvfilename, e)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return index
 
 
 def ento_data(csvfilename, metadata):
@@ -395,8 +1074,7 @@ def ento_data(csvfilename, metadata):
     df = df.dropna()
 
     df['date'] = pd.to_datetime(df['date'])
-    dateparser = lambda x: int(x.strftime('%m'))
-    df['Month'] = df['date'].apply(lambda x: int(dateparser(x)))
+    df['Month'] = df['date'].dt.month
     df2 = df.groupby('Month')['gambiae'].apply(np.mean).reset_index()
     df2['funestus'] = list(df.groupby('Month')['funestus'].apply(np.mean))
 
@@ -418,9 +1096,13 @@ def ento_data(csvfilename, metadata):
 
 def garki_ento_data(csvfilename, metadata):
 
-    df = pd.read_csv(csvfilename)
+    key = ('garki_ento', _hashable(metadata['village']), _hashable(metadata['species']))
+    return memoize_reference(csvfilename, key, lambda: _garki_ento_data(csvfilename, metadata))
+
+
+def _garki_ento_data(csvfilename, metadata):
 
-    df = df.loc[df['Village'] == metadata['village']]
+    df = village_reference_rows(csvfilename, metadata['village'])
     df['Channel'] = df['Channel'].apply(lambda x: x.split('.')[1].lower())
     df = df.loc[df['Channel'].isin(metadata['species'])]
 
@@ -434,7 +1116,106 @@ def garki_ento_data(csvfilename, metadata):
     return dftemp
 
 
-def hhs_to_nodes(csvfilename, hhs_file, metadata):
+def pair_trips(events, by=()):
+    """
+    Pair each traveler's successive emigration events (out, then back) into trips, for all groups at once
+    :param events: pandas.DataFrame of Emigrating events, e.g. from ReportHumanMigrationTracking.csv,
+                   with IndividualID and Time columns
+    :param by: columns identifying independent groups of events, e.g. ['Run_Number'] or ['MigrationType', 'Run_Number']
+    :return: pandas.DataFrame with one row per trip: the columns of the departing event, Trip (0, 1, ... per traveler)
+             and Duration; an unpaired last event of a traveler is dropped
+    """
+    by = list(by)
+    keys = by + ['IndividualID']
+    codes = [pd.factorize(events[k], sort=True)[0] for k in keys]
+
+    # one stable sort by (groups, individual, time); ties keep the report order
+    order = np.lexsort([events['Time'].values] + codes[::-1])
+    sorted_codes = [c[order] for c in codes]
+    n = len(order)
+
+    # position of each event within its traveler's events
+    new_traveler = np.zeros(n, dtype=bool)
+    new_traveler[:1] = True
+    for c in sorted_codes:
+        new_traveler[1:] |= c[1:] != c[:-1]
+    first = np.maximum.accumulate(np.where(new_traveler, np.arange(n), 0))
+    position = np.arange(n) - first
+
+    # departures at even positions with a following event of the same traveler
+    has_next = np.append(~new_traveler[1:], False)
+    departure = (position % 2 == 0) & has_next
+    out_rows, back_rows = order[departure], order[np.flatnonzero(departure) + 1]
+
+    trips = events.iloc[out_rows].reset_index(drop=True)
+    trips['Trip'] = position[departure] // 2
+    trips['Duration'] = events['Time'].values[back_rows] - events['Time'].values[out_rows]
+
+    return trips
+
+
+def projected_distance_km(point1, point2):
+    """
+    Distance in km between two (lat, lon) points on an equirectangular projection;
+    well within a grid cell of the geodesic distance over a catchment-sized area
+    :param point1: (lat, lon) in degrees
+    :param point2: (lat, lon) in degrees
+    :return: distance in km
+    """
+    lat1, lon1 = np.radians(point1)
+    lat2, lon2 = np.radians(point2)
+    x = (lon2 - lon1) * np.cos(0.5 * (lat1 + lat2))
+    y = lat2 - lat1
+
+    return 6371.0 * np.sqrt(x ** 2 + y ** 2)
+
+
+def assign_points_to_cells(points, xedges, yedges, valid_cells):
+    """
+    Label each point with the node of the grid cell it falls in; points in cells that are not valid
+    are assigned to the nearest valid cell centroid
+    :param points: (n, 2) array of (lon, lat)
+    :param xedges: cell edges along lon, as returned by np.histogram2d
+    :param yedges: cell edges along lat, as returned by np.histogram2d
+    :param valid_cells: boolean (num_cells_x, num_cells_y) mask of cells that become nodes
+    :return: integer node label per point; node i is the i-th valid cell in np.where(valid_cells) order
+    """
+    num_cells_x, num_cells_y = valid_cells.shape
+    if not valid_cells.any():
+        raise Exception('No grid cell passes the household threshold')
+
+    node_index = -np.ones(valid_cells.shape, dtype=np.int64)
+    node_index[valid_cells] = np.arange(valid_cells.sum())
+
+    # same binning as np.histogram2d: half-open cells, last cell closed on the right
+    idx_x = np.clip(np.digitize(points[:, 0], xedges) - 1, 0, num_cells_x - 1)
+    idx_y = np.clip(np.digitize(points[:, 1], yedges) - 1, 0, num_cells_y - 1)
+    labels = node_index[idx_x, idx_y]
+
+    orphans = labels < 0
+    if orphans.any():
+        from scipy.spatial import cKDTree
+
+        x_mid = (xedges[1:] + xedges[:-1]) / 2
+        y_mid = (yedges[1:] + yedges[:-1]) / 2
+        cells_x, cells_y = np.where(valid_cells)
+        centroids = np.column_stack([x_mid[cells_x], y_mid[cells_y]])
+        _, nearest = cKDTree(centroids).query(points[orphans])
+        labels[orphans] = nearest
+
+    return labels
+
+
+def hhs_to_nodes(csvfilename, hhs_file, metadata, distance_fn=projected_distance_km):
+    """
+    Bin health-facility households onto a square demographic grid and label each household with its node
+    :param csvfilename: household locations by health facility
+    :param hhs_file: household IDs
+    :param metadata: site metadata; 'hf' selects the health facility
+    :param distance_fn: callable((lat, lon), (lat, lon)) -> km used to size the grid,
+                        e.g. lambda a, b: geopy.distance.vincenty(a, b).km
+    :return: household records with a 'NodeID' column
+    """
 
     hh_hf_records = pd.read_csv(csvfilename)
     hh_hf_records = hh_hf_records[hh_hf_records['hf_name'] == metadata['hf']]
@@ -465,56 +1246,23 @@ def hhs_to_nodes(csvfilename, hhs_file, metadata):
 
     hh_records = all_hh_records[
         (all_hh_records.lon > x_min) & (all_hh_records.lon < x_max) & (all_hh_records.lat > y_min) & (
-        all_hh_records.lat < y_max)]
+        all_hh_records.lat < y_max)].copy()
 
     # get point locations of households
-    points = hh_records.as_matrix(["lon", "lat"])
+    points = hh_records[["lon", "lat"]].values
 
     # get number of grid cells along the x (grid width) and y axis (grid height) based on the bounding box dimensions and pixel/cell size
-    num_cells_x = int(1000 * vincenty((y_min, x_min), (y_min, x_max)).km / cell_size) + 1
-    num_cells_y = int(1000 * vincenty((y_min, x_min), (y_max, x_min)).km / cell_size) + 1
+    num_cells_x = int(1000 * distance_fn((y_min, x_min), (y_min, x_max)) / cell_size) + 1
+    num_cells_y = int(1000 * distance_fn((y_min, x_min), (y_max, x_min)) / cell_size) + 1
 
     # bin households in the grid
     H, xedges, yedges = np.histogram2d(points[:, 0], points[:, 1], bins=[num_cells_x, num_cells_y])
 
-    # get centroids of grid cells
-    x_mid = (xedges[1:] + xedges[:-1]) / 2
-    y_mid = (yedges[1:] + yedges[:-1]) / 2
-
-    # build a mesh of centroids
-    X_mid, Y_mid = np.meshgrid(x_mid[:], y_mid[:])
-
     # filter pixels/cells by number of households greater than a threshold in each cell
-    cells_masking = ma.masked_less(H, cell_household_threshold)
-    cells_mask = cells_masking.mask
-
-    # mask returns False for valid entries;  True would be easier to work with
-    inverted_filtered_households_mask = np.in1d(cells_mask.ravel(), [False]).reshape(cells_mask.shape)
-    filtered_household_cells_idx = np.where(inverted_filtered_households_mask)
-
-    # map between node coordinates and node label; to avoid look-up logic
-    coor_idxs_2_node_label = {}
-
-    for i, idx_x in enumerate(filtered_household_cells_idx[0]):
-        idx_y = filtered_household_cells_idx[1][i]
-
-        node_label = str(i)  # unique node label
-
-        coor_idxs_2_node_label[str(idx_x) + "_" + str(idx_y)] = node_label
-
-    node_label = [0]*len(hh_records)
-    for i in range(len(points)):
-        X = X_mid * np.transpose(inverted_filtered_households_mask)
-        Y = Y_mid * np.transpose(inverted_filtered_households_mask)
-        X[X == 0] = 'nan'
-        Y[Y == 0] = 'nan'
-        x = X_mid - points[i][0]
-        y = Y_mid - points[i][1]
-        dist = x**2 + y**2
-        neigh_cand = np.argwhere(dist == np.min(dist))
-        node_label[i] = coor_idxs_2_node_label[str(neigh_cand[0][0]) + "_" + str(neigh_cand[0][1])]
+    valid_cells = H >= cell_household_threshold
 
-    hh_records['NodeID'] =node_label
+    node_label = assign_points_to_cells(points, xedges, yedges, valid_cells)
+    hh_records['NodeID'] = node_label.astype(str)
 
     return hh_records
 
@@ -532,8 +1280,7 @@ def ento_spatial_data(datafilename, hhs_hffilename, hhs_file, metadata):
     df['NodeID'] = [random.randint(0, 32) for i in range(len(df))]
 
     df['date'] = pd.to_datetime(df['date'])
-    dateparser = lambda x: int(x.strftime('%m'))
-    df['Month'] = df['date'].apply(lambda x: int(dateparser(x)))
+    df['Month'] = df['date'].dt.month
     df2 = df.groupby(['Month', 'NodeID'])['gambiae'].apply(np.mean).reset_index()
     df2['funestus'] = list(df.groupby(['Month', 'NodeID'])['funestus'].apply(np.mean))
 
@@ -0,0 +1,181 @@
+"""
+Run the select_simulation_data stage of simtools-style analyzers (BaseAnalyzer subclasses, e.g. those in examples/)
+in a process pool over local simulation output directories, without COMPS, then finalize them in this process.
+
+Selected DataFrames are sent back from the workers as Arrow IPC streams when pyarrow is installed;
+other results, DataFrames with attrs (which Arrow does not keep), or all results without pyarrow, are pickled.
+"""
+import json
+import logging
+import os
+import pickle
+from collections import OrderedDict
+from multiprocessing import Pool, cpu_count
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+
+class LocalSimulation(object):
+    """
+    Stand-in for the simtools Simulation handed to select_simulation_data and finalize: id, tags and directory
+    """
+
+    def __init__(self, path, tags=None, id=None):
+        self.path = path
+        self.tags = tags or {}
+        self.id = id or os.path.basename(os.path.normpath(path))
+
+    def get_path(self):
+        return self.path
+
+    def __repr__(self):
+        return 'LocalSimulation(%s)' % self.id
+
+
+def find_local_simulations(experiment_dir, tags_filename='tags.json'):
+    """
+    :param experiment_dir: directory with one sub-directory per simulation, each holding its output/ directory
+    :param tags_filename: optional JSON file of simulation tags in each simulation directory
+    :return: list of LocalSimulation, sorted by directory name
+    """
+    simulations = []
+    for name in sorted(os.listdir(experiment_dir)):
+        path = os.path.join(experiment_dir, name)
+        if not os.path.isdir(os.path.join(path, 'output')):
+            continue
+        tags = None
+        tags_path = os.path.join(path, tags_filename)
+        if os.path.exists(tags_path):
+            with open(tags_path) as f:
+                tags = json.load(f)
+        simulations.append(LocalSimulation(path, tags=tags))
+    return simulations
+
+
+def load_output_file(path):
+    """
+    Parse a simulation output file as simtools does: JSON to dict, CSV to pandas.DataFrame, anything else to bytes
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.json':
+        with open(path) as f:
+            return json.load(f)
+    if extension == '.csv':
+        return pd.read_csv(path, skipinitialspace=True)
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def encode_result(result):
+    """
+    :return: ('arrow', bytes) for DataFrames without attrs when pyarrow is available, ('pickle', bytes) otherwise
+    """
+    if pa is not None and isinstance(result, pd.DataFrame) and not result.attrs:
+        try:
+            table = pa.Table.from_pandas(result)
+            sink = pa.BufferOutputStream()
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            return 'arrow', sink.getvalue().to_pybytes()
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError) as e:
+            logger.debug('Falling back to pickle for a result Arrow cannot hold: %s', e)
+    return 'pickle', pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def decode_result(encoding, payload):
+    if encoding == 'arrow':
+        return pa.ipc.open_stream(payload).read_pandas()
+    return pickle.loads(payload)
+
+
+_worker_analyzers = None
+
+
+def _init_worker(analyzers):
+    global _worker_analyzers
+    _worker_analyzers = analyzers
+
+
+def _select_simulation(simulation):
+    """
+    Load the files needed by the analyzers for one simulation and run their select_simulation_data
+    :return: (simulation id, list of encoded results or None for analyzers filtering out the simulation)
+    """
+    files = {}
+    results = []
+    for analyzer in _worker_analyzers:
+        if hasattr(analyzer, 'filter') and not analyzer.filter(simulation):
+            results.append(None)
+            continue
+        for filename in analyzer.filenames:
+            if filename not in files:
+                files[filename] = load_output_file(os.path.join(simulation.path, filename))
+        data = {filename: files[filename] for filename in analyzer.filenames}
+        results.append(encode_result(analyzer.select_simulation_data(data, simulation)))
+    return simulation.id, results
+
+
+def run_local_analysis(analyzers, simulations, processes=None, finalize=True):
+    """
+    Run select_simulation_data for every (analyzer, simulation) pair in a process pool, then finalize each analyzer
+    :param analyzers: an analyzer or list of analyzers with filenames, select_simulation_data and finalize;
+                      they are pickled to the worker processes
+    :param simulations: list of LocalSimulation, or an experiment directory for find_local_simulations
+    :param processes: number of worker processes, default all cores; 1 runs in this process
+    :param finalize: call finalize(all_data) on each analyzer
+    :return: list with, for each analyzer, an OrderedDict of simulation -> selected data
+    """
+    if not isinstance(analyzers, (list, tuple)):
+        analyzers = [analyzers]
+    if not isinstance(simulations, (list, tuple)):
+        simulations = find_local_simulations(simulations)
+
+    for analyzer in analyzers:
+        if hasattr(analyzer, 'initialize'):
+            analyzer.initialize()
+
+    processes = processes or cpu_count()
+    by_id = OrderedDict((s.id, s) for s in simulations)
+    if len(by_id) != len(simulations):
+        raise Exception('Local simulations must have unique ids')
+
+    logger.info('Analyzing %d simulations with %d processes', len(simulations), processes)
+    if processes == 1:
+        _init_worker(analyzers)
+        selected = map(_select_simulation, simulations)
+        pool = None
+    else:
+        pool = Pool(processes, initializer=_init_worker, initargs=(analyzers,))
+        selected = pool.imap_unordered(_select_simulation, simulations)
+
+    all_data = [{} for _ in analyzers]
+    try:
+        for sim_id, results in selected:
+            for i, result in enumerate(results):
+                if result is not None:
+                    all_data[i][by_id[sim_id]] = decode_result(*result)
+    except BaseException:
+        # a failed simulation or an interrupt: do not wait for the workers to finish the remaining simulations
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        raise
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    # simulation order, whatever order the workers finished in
+    all_data = [OrderedDict((s, d[s]) for s in simulations if s in d) for d in all_data]
+
+    if finalize:
+        for analyzer, data in zip(analyzers, all_data):
+            analyzer.finalize(data)
+
+    return all_data
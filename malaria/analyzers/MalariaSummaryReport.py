@@ -0,0 +1,193 @@
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from malaria.analyzers.Helpers import convert_annualized, convert_to_counts, age_from_birth_cohort, season_from_time
+
+logger = logging.getLogger(__name__)
+
+
+class MalariaSummaryReport(object):
+    """
+    Columnar reader for MalariaSummaryReport JSON output.
+
+    The report is walked once and only the requested channels are copied into contiguous, read-only
+    numpy arrays shaped (time[, PfPR bin][, age bin]); the parsed report itself is not kept. pandas.Series views with the same MultiIndex binning
+    as dtk's summary_channel_to_pandas are only built when first asked for, and share the array memory.
+    """
+
+    groupings = OrderedDict([('DataByTime', ('Time',)),
+                             ('DataByTimeAndAgeBins', ('Time', 'Age Bin')),
+                             ('DataByTimeAndPfPRBinsAndAgeBins', ('Time', 'PfPR Bin', 'Age Bin'))])
+
+    def __init__(self, data, channels):
+        """
+        :param data: parsed report (dict) or path to a MalariaSummaryReport JSON file
+        :param channels: channel names to extract
+        """
+        if not isinstance(data, dict):
+            with open(data) as f:
+                data = json.load(f)
+
+        metadata = data['Metadata']
+        self.start_day = metadata.get('Start_Day')
+        self.reporting_interval = metadata.get('Reporting_Interval')
+
+        self.bins = OrderedDict([('Time', np.array(data['DataByTime']['Time Of Report'])),
+                                 ('PfPR Bin', np.array(metadata.get('Parasitemia Bins', []))),
+                                 ('Age Bin', np.array(metadata.get('Age Bins', [])))])
+
+        self.arrays = OrderedDict()
+        self.bin_names = {}
+        self.extract(channels, data)
+
+        self._series = {}
+        self._derived = {}
+
+    def extract(self, channels, data=None):
+        """
+        Copy any of the channels not yet extracted into contiguous, read-only arrays
+        :param data: parsed report the arrays were read from, needed for channels not yet extracted
+        """
+        for channel in channels:
+            if channel in self.arrays:
+                continue
+            if data is None:
+                raise Exception('Channel %s was not extracted and no parsed report was given' % channel)
+
+            grouping = self.get_grouping(data, channel)
+            names = self.groupings[grouping]
+            shape = tuple(len(self.bins[name]) for name in names)
+
+            arr = np.array(data[grouping][channel], dtype=np.float64)
+            if arr.size != np.prod(shape):
+                raise Exception('Channel %s has %d values, expecting %s from %s bins' %
+                                (channel, arr.size, shape, names))
+            arr = arr.reshape(shape)
+            arr.flags.writeable = False
+
+            self.arrays[channel] = arr
+            self.bin_names[channel] = names
+
+    @classmethod
+    def get_grouping(cls, data, channel):
+        for grouping in data:
+            if grouping in cls.groupings and channel in data[grouping]:
+                return grouping
+        raise Exception('Unable to find channel %s in groupings %s' % (channel, list(data.keys())))
+
+    def array(self, channel):
+        """
+        :return: read-only numpy array for the channel, one axis per bin in self.bin_names[channel]
+        """
+        return self.arrays[channel]
+
+    def index(self, channel):
+        names = self.bin_names[channel]
+        if len(names) == 1:
+            return pd.Index(self.bins[names[0]], name=names[0])
+        return pd.MultiIndex.from_product([self.bins[name] for name in names], names=names)
+
+    def series(self, channel):
+        """
+        :return: pandas.Series with binned MultiIndex, built on first access and backed by the channel array
+        """
+        if channel not in self._series:
+            s = pd.Series(self.arrays[channel].ravel(), index=self.index(channel), name=channel, copy=False)
+            s.Start_Day = self.start_day
+            s.Reporting_Interval = self.reporting_interval
+            self._series[channel] = s
+        return self._series[channel]
+
+    def __getitem__(self, channel):
+        return self.series(channel)
+
+    def __contains__(self, channel):
+        return channel in self.arrays
+
+    @staticmethod
+    def read_only(s):
+        values = s.values.copy()
+        values.flags.writeable = False
+        return pd.Series(values, index=s.index, name=s.name, copy=False)
+
+    def person_years(self, channel):
+        """
+        :return: annualized population channel converted to person-years per reporting interval
+        """
+        key = ('person_years', channel)
+        if key not in self._derived:
+            s = self.series(channel)
+            py = convert_annualized(s, start_day=s.Start_Day, reporting_interval=s.Reporting_Interval)
+            self._derived[key] = self.read_only(py[channel])
+        return self._derived[key]
+
+    def counts(self, channel, population_channel, annualized=False):
+        """
+        :return: channel rates converted to counts using the population channel,
+                 or person-years of the population channel for annualized rates
+        """
+        key = ('counts', channel, population_channel, annualized)
+        if key not in self._derived:
+            pops = self.person_years(population_channel) if annualized else self.series(population_channel)
+            self._derived[key] = self.read_only(convert_to_counts(self.series(channel), pops))
+        return self._derived[key]
+
+    def birth_cohort(self, channel, population_channel, annualized=False, by_season=False, seasons=None):
+        """
+        Counts of a channel as a flat DataFrame with 'Time' reinterpreted as 'Age Bin' for a birth cohort,
+        and also as 'Season' (or 'Month' without a seasons lookup) when by_season is True.
+        For annualized rates, the person-years of the population channel are included as 'Trials'.
+        N.B. the DataFrame is shared by all callers and must not be modified in place.
+        """
+        seasons_key = tuple(sorted(seasons.items())) if by_season and seasons else None
+        key = ('birth_cohort', channel, population_channel, annualized, by_season, seasons_key)
+        if key not in self._derived:
+            counts = self.counts(channel, population_channel, annualized)
+            if annualized:
+                counts = pd.concat([counts, self.person_years(population_channel).rename('Trials')], axis=1)
+
+            df = counts.reset_index()
+            df = age_from_birth_cohort(df)
+            if by_season:
+                df = season_from_time(df, seasons=seasons)
+            self._derived[key] = df
+        return self._derived[key]
+
+
+max_shared_reports = 8
+_shared_reports = OrderedDict()
+_shared_reports_lock = threading.Lock()
+
+
+def shared_summary_report(data, channels, sim_id=None, filename=None):
+    """
+    Return the MalariaSummaryReport for a parsed report, extracting it only once for all analyzers
+    applied to the same simulation output, e.g. the several analyzers returned by a CalibSite.
+    Reports are shared by simulation id and report file name, and hold only the extracted arrays,
+    so the parsed report can be released as soon as the analyzers are done with it.
+    :param data: parsed MalariaSummaryReport JSON (dict), as handed to each analyzer
+    :param channels: channel names needed by the calling analyzer
+    :param sim_id: id of the simulation the report belongs to; None for a report that is not shared
+    :param filename: name of the report file, e.g. the analyzer's filenames entry
+    :return: MalariaSummaryReport shared between callers; arrays and derived quantities are read-only
+    """
+    if sim_id is None:
+        return MalariaSummaryReport(data, channels)
+
+    key = (sim_id, filename)
+    with _shared_reports_lock:
+        report = _shared_reports.get(key)
+        if report is None:
+            report = MalariaSummaryReport(data, channels)
+            _shared_reports[key] = report
+            while len(_shared_reports) > max_shared_reports:
+                _shared_reports.popitem(last=False)
+        else:
+            _shared_reports.move_to_end(key)
+            report.extract(channels, data)
+        return report
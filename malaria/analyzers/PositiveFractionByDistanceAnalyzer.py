@@ -1,11 +1,13 @@
 
 import logging
+from collections import OrderedDict
 
 import pandas as pd
 
 from calibtool import LL_calculators
-from calibtool.analyzers.Helpers import get_spatial_report_data_at_date, get_risk_by_distance
+from malaria.analyzers.Helpers import get_spatial_report_data_at_date, get_risk_by_distance, DistanceRingIndex
 from calibtool.analyzers.BaseCalibrationAnalyzer import BaseCalibrationAnalyzer
+from malaria.analyzers.CompactCache import CompactCache, cache_name, write_compact_cache
 
 
 logger = logging.getLogger(__name__)
@@ -24,9 +26,18 @@ class PositiveFractionByDistanceAnalyzer(BaseCalibrationAnalyzer):
     def __init__(self, site, weight=1, compare_fn=LL_calculators.euclidean_distance, **kwargs):
         super(PositiveFractionByDistanceAnalyzer, self).__init__(site, weight, compare_fn)
         self.testday = kwargs.get('testday')
+        self.cache_format = kwargs.get('cache_format', 'json')  # or 'compact': one array file in cache_dir
+        self.cache_dir = kwargs.get('cache_dir', 'compact_cache')
         self.reference = site.get_reference_data('risk_by_distance')
         self.ignore_nodes = site.get_ignore_node_list()
-        self.distmat = site.get_distance_matrix()
+
+        # Neighbors by distance ring are fixed for the site: index them once rather than per simulation
+        if hasattr(site, 'get_distance_ring_index'):
+            self.ring_index = site.get_distance_ring_index()
+        else:
+            distmat = site.get_distance_matrix()
+            self.ring_index = DistanceRingIndex.from_frame(distmat, self.reference['distances']) \
+                if distmat is not None else None
 
     def filter(self, sim_metadata):
         '''
@@ -53,7 +64,7 @@ class PositiveFractionByDistanceAnalyzer(BaseCalibrationAnalyzer):
         df['pos'] = df['prev']*df['pop']
         ref_distance = self.reference['distances']
         
-        positive_fraction = get_risk_by_distance(df, ref_distance, self.distmat)
+        positive_fraction = get_risk_by_distance(df, ref_distance, self.ring_index)
         
         channel_data = pd.DataFrame({ self.y : positive_fraction + [df['pos'].sum()/df['pop'].sum()]},
                                       index=ref_distance+[1000])
@@ -98,9 +109,15 @@ class PositiveFractionByDistanceAnalyzer(BaseCalibrationAnalyzer):
         to reference comparisons.
         '''
 
-        cache = self.data.copy()
-        cache = cache[[self.y]].reset_index(level=self.x)
-        sample_dicts = [df.to_dict(orient='list') for idx, df in cache.groupby(level='sample', sort=True)]
+        if self.cache_format == 'compact':
+            by_sample = self.data[self.y].unstack(self.x).sort_index()  # samples x distances
+            sample_dicts = write_compact_cache(self.cache_dir, cache_name(self), by_sample.index.tolist(),
+                                               OrderedDict([(self.x, by_sample.columns.values)]), [self.y],
+                                               by_sample.values[:, :, None])
+        else:
+            cache = self.data.copy()
+            cache = cache[[self.y]].reset_index(level=self.x)
+            sample_dicts = [df.to_dict(orient='list') for idx, df in cache.groupby(level='sample', sort=True)]
         logger.debug(sample_dicts)
 
         return {'samples': sample_dicts, 'ref': self.reference, 'axis_names': [self.x, self.y]}
@@ -126,6 +143,7 @@ class PositiveFractionByDistanceAnalyzer(BaseCalibrationAnalyzer):
             ax.xaxis.set_major_locator(FixedLocator(range(numpoints)))
             ax.set_xticklabels(['hh'] + [str(i) for i in data['distances'][1:]] + ['all'])
         else :
+            data = CompactCache.resolve(data)
             numpoints = len(data['distance'])
             ax.plot(range(numpoints), data['Risk of RDT Positive'], *args, **kwargs)
 
@@ -1,10 +1,15 @@
 
 import logging
+import threading
+from collections import OrderedDict
 
+import numpy as np
 import pandas as pd
 
 from calibtool import LL_calculators
 from calibtool.analyzers.BaseCalibrationAnalyzer import BaseCalibrationAnalyzer
+from malaria.analyzers.CompactCache import CompactCache, cache_name, write_compact_cache
+from malaria.analyzers.Helpers import binomial_error_bars
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +26,8 @@ class PrevalenceByRoundAnalyzer(BaseCalibrationAnalyzer):
         super(PrevalenceByRoundAnalyzer, self).__init__(site, weight, compare_fn)
         self.reference = site.get_reference_data('prevalence_by_round')
         self.refdf = pd.DataFrame(self.reference)
+        self.cache_format = kwargs.get('cache_format', 'json')  # or 'compact': one array file in cache_dir
+        self.cache_dir = kwargs.get('cache_dir', 'compact_cache')
         self.regions = site.get_region_list()
         # self.regions = self.reference['grid_cell'].unique()
         self.filenames = ['output/ReportMalariaFiltered.json']
@@ -31,6 +38,23 @@ class PrevalenceByRoundAnalyzer(BaseCalibrationAnalyzer):
         else :
             self.filenames = region_filenames
 
+        # Round dates and reference prevalence of each region, in reference order, fixed for the life of the analyzer;
+        # the report of each region is indexed with its own round dates
+        self.sim_dates, self.ref_prev = OrderedDict(), OrderedDict()
+        for region, rdf in self.refdf.groupby('grid_cell', sort=False):
+            dates = rdf['sim_date'].values.astype(np.int64)
+            if len(np.unique(dates)) != len(dates):
+                raise Exception('Reference prevalence_by_round of %s has more than one round on the same sim_date: %s'
+                                % (region, dates.tolist()))
+            self.sim_dates[region], self.ref_prev[region] = dates, rdf['prev'].values
+        missing = [region for region in self.regions if region not in self.sim_dates]
+        if missing:
+            logger.warning('No prevalence_by_round reference for regions %s of %s', missing, site.name)
+
+        # Population ('N') of the reference table is set once from the first simulation if not provided
+        self.population_set = 'N' in self.refdf.columns
+        self.population_lock = threading.Lock()
+
     def filter(self, sim_metadata):
         '''
         This analyzer only needs to analyze simulations for the site it is linked to.
@@ -43,38 +67,50 @@ class PrevalenceByRoundAnalyzer(BaseCalibrationAnalyzer):
         '''
         Extract data from output data
         '''
-        dfs = []
-        set_N = False
-        if 'N' not in self.refdf.columns:
-            set_N = True
-            Ndf = pd.DataFrame()
+        regions, prevalence, population = [], [], []
 
         for i, region in enumerate(self.regions) :
-            data = [parser.raw_data[self.filenames[i]]['Channels'][self.y]['Data'][x] for x in self.refdf['sim_date'].values]
-            pop = [parser.raw_data[self.filenames[i]]['Channels']['Statistical Population']['Data'][x] for x in self.refdf['sim_date'].values]
-
-            df = pd.DataFrame({ self.y: data},
-                                index=self.refdf['sim_date'].values)
-            df.region = region
-            df.index.name = 'sim_date'
-            dfs.append(df)
-
-            if set_N :
-                t = pd.DataFrame({ 'grid_cell' : [region]*len(pop),
-                                   'N' : pop})
-                t['sim_date'] = self.refdf['sim_date']
-                Ndf = pd.concat([Ndf, t])
-
-        if set_N :
-            self.refdf = pd.merge(left=self.refdf, right=Ndf, on=['grid_cell', 'sim_date'])
-
-        c = pd.concat(dfs, axis=1, keys=self.regions, names=['region'])
-        channel_data = c.stack(['region'])
+            if region not in self.sim_dates :
+                continue
+            channels = parser.raw_data[self.filenames[i]]['Channels']
+            regions.append(region)
+            prevalence.append(np.asarray(channels[self.y]['Data'])[self.sim_dates[region]])
+            population.append(np.asarray(channels['Statistical Population']['Data'])[self.sim_dates[region]])
+
+        if not self.population_set :
+            self.set_reference_population(regions, population)
+
+        index = pd.MultiIndex.from_arrays([np.concatenate([self.sim_dates[region] for region in regions]),
+                                           np.repeat(regions, [len(self.sim_dates[region]) for region in regions])],
+                                          names=['sim_date', 'region'])
+        channel_data = pd.DataFrame({self.y: np.concatenate(prevalence)}, index=index)
         channel_data.sample = parser.sim_data.get('__sample_index__')
         channel_data.sim_id = parser.sim_id
 
         return channel_data
 
+    def set_reference_population(self, regions, population):
+        '''
+        Freeze the population ('N') by region and round of the reference table
+        from one array per region, on that region's round dates
+        '''
+        with self.population_lock :
+            if self.population_set :
+                return
+            Ndf = pd.DataFrame({'grid_cell': np.repeat(regions, [len(self.sim_dates[region]) for region in regions]),
+                                'sim_date': np.concatenate([self.sim_dates[region] for region in regions]),
+                                'N': np.concatenate(population)})
+            self.refdf = pd.merge(left=self.refdf, right=Ndf.astype({'sim_date': self.refdf['sim_date'].dtype}),
+                                  on=['grid_cell', 'sim_date'], how='left')
+            self.population_set = True
+
+    def rounds(self, region, df):
+        '''
+        Simulated values of a region in the round order of its reference
+        '''
+        values = pd.Series(df[self.y].values, index=df.index.get_level_values('sim_date'))
+        return values.reindex(self.sim_dates[region]).values
+
     def combine(self, parsers):
         '''
         Combine the simulation data into a single table for all analyzed simulations.
@@ -92,8 +128,8 @@ class PrevalenceByRoundAnalyzer(BaseCalibrationAnalyzer):
         Assess the result per sample, in this case the likelihood
         comparison between simulation and reference data.
         '''
-        return sum([self.compare_fn(self.refdf[self.refdf['grid_cell']==region]['prev'].values,
-                                    df[self.y].tolist()) for (region, df) in sample.groupby(level='region')])
+        return sum([self.compare_fn(self.ref_prev[region], self.rounds(region, df).tolist())
+                    for (region, df) in sample.groupby(level='region')])
 
     def finalize(self):
         '''
@@ -108,11 +144,31 @@ class PrevalenceByRoundAnalyzer(BaseCalibrationAnalyzer):
     #     to reference comparisons.
     #     '''
         cache = self.data.copy()
+        regions = [region for region in self.regions if region in self.sim_dates]
 
-        sample_dicts = []
+        # per sample and region, the simulated rounds in reference order
+        by_sample = OrderedDict()
         for idx, df in cache.groupby(level='sample', sort=True) :
-            d = { 'region' : self.regions,
-                   self.y : [sdf[self.y].values.tolist() for jdx, sdf in df.groupby(level='region') ] }
+            by_region = {region: rdf for region, rdf in df.groupby(level='region')}
+            by_sample[idx] = [self.rounds(region, by_region[region]) if region in by_region
+                              else np.full(len(self.sim_dates[region]), np.nan) for region in regions]
+
+        if self.cache_format == 'compact':
+            # regions with fewer rounds are padded with NaN
+            n_rounds = max(len(dates) for dates in self.sim_dates.values())
+            values = np.full((len(by_sample), len(regions), n_rounds), np.nan)
+            for i, rounds in enumerate(by_sample.values()):
+                for j, v in enumerate(rounds):
+                    values[i, j, :len(v)] = v
+            sample_dicts = write_compact_cache(self.cache_dir, cache_name(self), list(by_sample.keys()),
+                                               OrderedDict([('region', regions)]), list(range(1, n_rounds + 1)),
+                                               values, row_channel=self.y)
+            return {'samples': sample_dicts, 'ref': self.reference, 'axis_names': ['region', self.y]}
+
+        sample_dicts = []
+        for rounds in by_sample.values() :
+            d = { 'region' : regions,
+                   self.y : [v.tolist() for v in rounds] }
             sample_dicts.append(d)
 
         logger.debug(sample_dicts)
@@ -136,15 +192,22 @@ class PrevalenceByRoundAnalyzer(BaseCalibrationAnalyzer):
             else :
                 data = pd.DataFrame(data)
             region_list = data['grid_cell'].unique()
+            # 68% binomial intervals when the reference has the number of people per round ('N')
+            errs = {r: binomial_error_bars(rdf['N'].values, rdf['prev'].values * rdf['N'].values)
+                    for r, rdf in data.groupby('grid_cell')} if 'N' in data.columns else {}
             data = { r : rdf['prev'].values for r,rdf in data.groupby('grid_cell')}
         else :
+            data = CompactCache.resolve(data)
             region_list = data['region']
             channelname = [x for x in data.keys() if 'region' not in x][0]
         numregions = len(region_list)
 
         for i, region in enumerate(region_list) :
             ax = fig.add_subplot(max([1, (numregions+1)/2]), min([numregions, 2]), i+1)
-            if ref :
+            if ref and region in errs :
+                ax.errorbar(range(1, len(data[region])+1), data[region], yerr=errs[region], fmt=fmt_str or '',
+                            **kwargs)
+            elif ref :
                 ax.plot(range(1, len(data[region])+1), data[region], *args, **kwargs)
             else :
                 ax.plot(range(1, len(data[channelname][i]) + 1), data[channelname][i], *args, **kwargs)
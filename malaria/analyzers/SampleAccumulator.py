@@ -0,0 +1,82 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class SampleAccumulator(object):
+    """
+    Running per-sample sums and counts of simulation data binned on a common index.
+
+    Each simulation's selected data is folded into (sample, bin, channel) arrays as it arrives,
+    so memory grows with the number of samples and bins but not with the number of replicate simulations.
+    mean() is equivalent to concatenating every simulation's data on the columns
+    and taking groupby(level=['sample', 'channel'], axis=1).mean().
+    """
+
+    def __init__(self):
+        self.index = None
+        self.columns = pd.Index([])
+        self.samples = pd.Index([])
+        self.sums = np.zeros((0, 0, 0))
+        self.counts = np.zeros((0, 0, 0), dtype=np.int64)
+
+    def _grow(self, index, columns, sample):
+        """
+        Extend the bins, channels and samples to include new ones, keeping the existing sums and counts
+        """
+        new_index = index if self.index is None else self.index.union(index)
+        new_columns = self.columns.union(columns)
+        new_samples = self.samples.union([sample])
+
+        if self.index is not None and new_index.equals(self.index) \
+                and new_columns.equals(self.columns) and new_samples.equals(self.samples):
+            return
+
+        shape = (len(new_samples), len(new_index), len(new_columns))
+        sums = np.zeros(shape)
+        counts = np.zeros(shape, dtype=np.int64)
+        if self.index is not None and self.sums.size:
+            ix = np.ix_(new_samples.get_indexer(self.samples),
+                        new_index.get_indexer(self.index),
+                        new_columns.get_indexer(self.columns))
+            sums[ix] = self.sums
+            counts[ix] = self.counts
+
+        self.index, self.columns, self.samples = new_index, new_columns, new_samples
+        self.sums, self.counts = sums, counts
+
+    def add(self, sample, data):
+        """
+        Accumulate one simulation's selected data
+        :param sample: sample index of the simulation
+        :param data: pandas.DataFrame (or Series) of channels indexed on bins
+        """
+        if isinstance(data, pd.Series):
+            data = data.to_frame()
+
+        self._grow(data.index, data.columns, sample)
+
+        row = self.samples.get_loc(sample)
+        bins = self.index.get_indexer(data.index)
+        cols = self.columns.get_indexer(data.columns)
+
+        values = data.values.astype(np.float64)
+        observed = ~np.isnan(values)
+        ix = np.ix_(bins, cols)
+        self.sums[row][ix] += np.where(observed, values, 0)
+        self.counts[row][ix] += observed
+
+    def mean(self):
+        """
+        :return: pandas.DataFrame of NaN-skipping means indexed on bins, with (sample, channel) MultiIndex columns
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.where(self.counts > 0, self.sums / self.counts, np.nan)
+
+        columns = pd.MultiIndex.from_product([self.samples, self.columns], names=['sample', 'channel'])
+        values = means.transpose(1, 0, 2).reshape(len(self.index), -1)  # bins x (sample, channel)
+
+        return pd.DataFrame(values, index=self.index, columns=columns)
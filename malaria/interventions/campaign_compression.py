@@ -0,0 +1,168 @@
+"""
+Compression of node-targeted campaigns: events that differ only by the nodes they target are merged into one event
+with a combined NodeSetNodeList.
+
+Two stages, usable separately:
+- compress_node_table bins an intervention table keyed by node (one row per node and day, e.g. the Magude
+  grid-cell ITN, IRS, MDA, MSAT and health-seeking tables) within tolerances and groups nodes with equal binned values,
+  so that each group is added with a single call to the intervention helper.
+- merging_node_events buffers the events added to a config builder and merges those with identical payloads.
+"""
+import json
+import logging
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class CampaignCompression(namedtuple('CampaignCompression', ['events', 'n_rows'])):
+    """
+    events: list of (values, node_list), values a dict of the binned fields of the rows merged into the event
+    n_rows: number of rows or events before compression
+    """
+
+    @property
+    def n_events(self):
+        return len(self.events)
+
+    @property
+    def ratio(self):
+        return float(self.n_rows) / self.n_events if self.n_events else 1.0
+
+    def __iter__(self):
+        return iter(self.events)
+
+    def __len__(self):
+        return len(self.events)
+
+
+def bin_values(values, tolerance):
+    """
+    Round values to the nearest multiple of tolerance, without floating-point residue (0.30000000000000004)
+    :param tolerance: bin width, 0 or None to leave values as they are
+    """
+    values = np.asarray(values, dtype=float)
+    if not tolerance:
+        return values
+    decimals = max(0, -int(np.floor(np.log10(tolerance))))
+    return np.round(np.round(values / tolerance) * tolerance, decimals)
+
+
+def compress_node_table(df, fields, tolerances=None, default_tolerance=0.1, day_column='simday', day_tolerance=10,
+                        node_column='grid_cell'):
+    """
+    Group the rows of a node-keyed intervention table whose values are equal within tolerances
+
+    :param df: pandas.DataFrame with one row per node and day
+    :param fields: intervention fields which have to match (after binning) for rows to be merged
+    :param tolerances: dict field -> bin width overriding default_tolerance; 0 or None requires exact matches,
+                       e.g. for categorical fields
+    :param default_tolerance: bin width of fields not in tolerances
+    :param day_column: start day column, binned with day_tolerance
+    :param day_tolerance: bin width of the start day
+    :param node_column: node ID column
+    :return: CampaignCompression with one (values, sorted unique node list) per group, ordered by binned values
+    """
+    tolerances = tolerances or {}
+    fields = list(fields)
+    binned = df[[node_column]].copy()
+    binned[day_column] = bin_values(df[day_column], day_tolerance)
+    for field in fields:
+        tolerance = tolerances.get(field, default_tolerance)
+        binned[field] = bin_values(df[field], tolerance) if tolerance else df[field]
+
+    data_fields = [day_column] + fields
+    events = []
+    for table, group in binned.groupby(data_fields, sort=True):
+        values = dict(zip(data_fields, (v.item() if isinstance(v, np.generic) else v for v in table)))
+        events.append((values, [n.item() for n in np.unique(group[node_column].values)]))
+
+    compression = CampaignCompression(events, len(df))
+    logger.info('Compressed %d rows of %s into %d events (%.1fx)',
+                compression.n_rows, ', '.join(fields), compression.n_events, compression.ratio)
+    return compression
+
+
+def _event_dict(event):
+    if isinstance(event, dict):
+        return event
+    if hasattr(event, 'raw_data'):
+        return event.raw_data
+    return None
+
+
+def _node_list_key(event):
+    """
+    :return: key of the event without its nodes, or None for events not targeting a NodeSetNodeList
+    """
+    event = _event_dict(event)
+    if event is None:
+        return None
+    nodeset = event.get('Nodeset_Config')
+    if not isinstance(nodeset, dict) or nodeset.get('class') != 'NodeSetNodeList':
+        return None
+    payload = dict(event, Nodeset_Config=dict(nodeset, Node_List=None))
+    return json.dumps(payload, sort_keys=True, default=str)
+
+
+def merge_node_events(events):
+    """
+    Merge events which differ only by the Node_List of their NodeSetNodeList
+
+    :param events: list of RawCampaignObject or event dicts
+    :return: CampaignCompression of the events in first-occurrence order, as (event, node list) pairs;
+             node_list is None for events that were not merged (other node sets or other campaign classes)
+    """
+    merged = OrderedDict()
+    for i, event in enumerate(events):
+        key = _node_list_key(event)
+        if key is None:
+            merged[i] = (event, None)
+            continue
+        nodes = _event_dict(event)['Nodeset_Config']['Node_List']
+        if key in merged:
+            merged[key][1].extend(nodes)
+        else:
+            merged[key] = (event, list(nodes))
+
+    compression = CampaignCompression([(event, None if nodes is None else sorted(set(nodes)))
+                                       for event, nodes in merged.values()], len(events))
+    logger.info('Merged %d campaign events into %d (%.1fx)',
+                compression.n_rows, compression.n_events, compression.ratio)
+    return compression
+
+
+@contextmanager
+def merging_node_events(cb):
+    """
+    Buffer the events added to cb in the block and add them merged by merge_node_events at the end.
+    Can be nested inside malaria.interventions.campaign_writer.streaming_campaign.
+
+    :param cb: The :py:class:`DTKConfigBuilder <dtk.utils.core.DTKConfigBuilder>` receiving the events
+    :return: list that will hold the CampaignCompression once the block exits
+    """
+    from dtk.utils.Campaign.utils.RawCampaignObject import RawCampaignObject
+
+    previous = vars(cb).get('add_event')
+    buffered = []
+    report = []
+    cb.add_event = buffered.append
+    try:
+        yield report
+    finally:
+        if previous is None:
+            del cb.add_event
+        else:
+            cb.add_event = previous
+
+    compression = merge_node_events(buffered)
+    for event, nodes in compression:
+        if nodes is not None:
+            event = dict(_event_dict(event))
+            event['Nodeset_Config'] = dict(event['Nodeset_Config'], Node_List=nodes)
+            event = RawCampaignObject(event)
+        cb.add_event(event)
+    report.append(compression)
@@ -0,0 +1,155 @@
+"""
+Stream campaign events to the campaign file as they are added to a config builder, instead of holding them
+on the builder until the campaign is serialized. Meant for node-targeted campaigns with tens of thousands of events,
+e.g. the Magude grid-cell interventions.
+
+    campaign_file = os.path.join('inputs', 'campaign_magude.json')
+    with streaming_campaign(cb, campaign_file, campaign_filename='Assets/campaign_magude.json'):
+        add_all_interventions(cb, sim_start_date='2010-01-01')
+    cb.experiment_files.add_file(campaign_file)
+"""
+import json
+import logging
+import os
+import tempfile
+from contextlib import contextmanager
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def event_to_json(event):
+    """
+    :param event: RawCampaignObject, other dtk campaign class with to_json, or event dict
+    :return: JSON-serializable event dict
+    """
+    if isinstance(event, dict):
+        return event
+    if hasattr(event, 'raw_data'):
+        return event.raw_data
+    if hasattr(event, 'to_json'):
+        event = event.to_json()
+        return json.loads(event) if isinstance(event, str) else event
+    raise Exception('Cannot serialize campaign event of type %s' % type(event).__name__)
+
+
+def _numpy_default(o):
+    # node lists are often built from pandas columns, e.g. sorted(group['grid_cell'])
+    if isinstance(o, np.generic):
+        return o.item()
+    if isinstance(o, np.ndarray):
+        return o.tolist()
+    raise TypeError('Object of type %s is not JSON serializable' % type(o).__name__)
+
+
+class CampaignStreamWriter(object):
+    """
+    Campaign file written one event at a time with incremental JSON encoding.
+    The file is written to a temporary file in the same directory and only moved into place by close().
+    """
+
+    def __init__(self, path, campaign_name='Campaign', use_defaults=True, indent=None):
+        """
+        :param path: campaign file to write
+        :param campaign_name: Campaign_Name of the campaign
+        :param use_defaults: Use_Defaults of the campaign
+        :param indent: indent of each event, None for compact output
+        """
+        self.path = path
+        self.n_events = 0
+        self._encoder = json.JSONEncoder(indent=indent, default=_numpy_default)
+        self._file = tempfile.NamedTemporaryFile('w', dir=os.path.dirname(os.path.abspath(path)),
+                                                 prefix=os.path.basename(path) + '.', suffix='.tmp', delete=False)
+        self._tmp_path = self._file.name
+        self._file.write('{"Campaign_Name": %s, "Use_Defaults": %d, "Events": [\n'
+                         % (json.dumps(campaign_name), int(use_defaults)))
+
+    def add_event(self, event):
+        if self._file is None:
+            raise Exception('Campaign stream %s is already closed' % self.path)
+        if self.n_events:
+            self._file.write(',\n')
+        for chunk in self._encoder.iterencode(event_to_json(event)):
+            self._file.write(chunk)
+        self.n_events += 1
+
+    def close(self):
+        """
+        Terminate the event list and move the campaign file into place
+        """
+        if self._file is None:
+            return
+        self._file.write('\n]}\n')
+        self._file.close()
+        self._file = None
+        os.replace(self._tmp_path, self.path)
+        logger.info('Wrote %d campaign events to %s', self.n_events, self.path)
+
+    def discard(self):
+        """
+        Drop the partially written campaign file
+        """
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        os.remove(self._tmp_path)
+
+
+class _StreamedCampaignGuard(object):
+    """
+    Stands in for cb.add_event once Campaign_Filename points at a streamed campaign file,
+    so that events which the simulation would never read are refused instead of silently dropped
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, event):
+        raise Exception('Campaign_Filename points at the streamed campaign %s: '
+                        'add campaign events inside the streaming_campaign block' % self.path)
+
+
+@contextmanager
+def streaming_campaign(cb, path, set_campaign_filename=True, campaign_filename=None, **kwargs):
+    """
+    Redirect cb.add_event to a CampaignStreamWriter for the duration of the block.
+    Every intervention helper adding its events through cb.add_event (malaria.interventions, dtk.interventions,
+    site setup functions) is streamed to the file unchanged.
+
+    When set_campaign_filename is True the simulation no longer reads the builder's own campaign:
+    events already on it are reported with a warning, and adding events after the block raises.
+
+    The campaign file is written locally and is not uploaded by itself: add it to the experiment assets with
+    cb.experiment_files.add_file(path) and point Campaign_Filename at the assets directory,
+    e.g. campaign_filename='Assets/campaign_magude.json'.
+
+    :param cb: The :py:class:`DTKConfigBuilder <dtk.utils.core.DTKConfigBuilder>` whose events are streamed
+    :param path: campaign file to write
+    :param set_campaign_filename: point the Campaign_Filename parameter at the streamed file on success
+    :param campaign_filename: Campaign_Filename as seen by the simulation, default the file name of path
+    :param kwargs: passed to CampaignStreamWriter
+    :return: the CampaignStreamWriter
+    """
+    if isinstance(vars(cb).get('add_event'), _StreamedCampaignGuard):
+        raise Exception('Campaign events of this config builder are already streamed to %s' % cb.add_event.path)
+    if 'add_event' in vars(cb):
+        raise Exception('Campaign events of this config builder are already redirected')
+    writer = CampaignStreamWriter(path, **kwargs)
+    cb.add_event = writer.add_event
+    try:
+        yield writer
+    except BaseException:
+        writer.discard()
+        raise
+    finally:
+        del cb.add_event
+    writer.close()
+    if set_campaign_filename:
+        n_builder_events = len(getattr(getattr(cb, 'campaign', None), 'Events', None) or [])
+        if n_builder_events:
+            logger.warning('%d campaign events added before streaming to %s are not in the streamed campaign',
+                           n_builder_events, path)
+        cb.update_params({'Campaign_Filename': campaign_filename or os.path.basename(path)})
+        cb.add_event = _StreamedCampaignGuard(path)
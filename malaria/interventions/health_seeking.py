@@ -1,4 +1,5 @@
 from dtk.utils.Campaign.utils.RawCampaignObject import RawCampaignObject
+from malaria.interventions.malaria_drugs import antimalarial_drug
 
 expire_recent_drugs = {"class": "PropertyValueChanger",
                        "Target_Property_Key": "DrugStatus",
@@ -75,7 +76,7 @@ def add_health_seeking(config_builder,
 
         actual_config = build_actual_treatment_cfg(t['rate'], drug_config, drugs)
         if disqualifying_properties:
-            actual_config['Disqualifying_Properties'] = disqualifying_properties
+            actual_config = dict(actual_config, Disqualifying_Properties=disqualifying_properties)
         health_seeking_config = {
             "class": "StandardInterventionDistributionEventCoordinator",
             "Number_Repetitions": repetitions,
@@ -191,19 +192,13 @@ def get_drug_config(drug, dosing, receiving_drugs_event, drug_ineligibility_dura
     # if drug variable is a list, let's use MultiInterventionDistributor
     if isinstance(drug, str):
         # print('Just a single drug: ' + drug)
-        drug_config = {"Cost_To_Consumer": 1,
-                       "Drug_Type": drug,
-                       "Dosing_Type": dosing,
-                       "class": "AntimalarialDrug"}
+        drug_config = antimalarial_drug(drug, dosing, cost=1)
         drugs = drug
     elif isinstance(drug, list):
         # print('Multiple drugs: ' + '+'.join(drug))
         drugs = []
         for d in drug:
-            drugs.append({"Cost_To_Consumer": 1,
-                          "Drug_Type": d,
-                          "Dosing_Type": dosing,
-                          "class": "AntimalarialDrug"})
+            drugs.append(antimalarial_drug(d, dosing, cost=1))
         drugs.append(receiving_drugs_event)
         if drug_ineligibility_duration > 0 :
             drugs.append(expire_recent_drugs)
@@ -6,6 +6,42 @@ from copy import deepcopy, copy
 import random
 
 
+class CampaignEventTemplate(object):
+    """
+    Campaign event skeleton built once and stamped out for each event that differs only in a few fields,
+    e.g. Start_Day for every start day and repetition of a campaign.
+    Only the dicts on the paths to the stamped fields are copied; every other block is shared by all stamped events,
+    so neither the template event nor the stamped events may be modified in place.
+    """
+
+    def __init__(self, event, **fields):
+        """
+        :param event: campaign event dict
+        :param fields: field name -> tuple of keys leading to the field in the event,
+        e.g. start_day=('Start_Day',), coverage=('Event_Coordinator_Config', 'Demographic_Coverage')
+        """
+        self.event = event
+        self.fields = fields
+
+    def stamp(self, **values):
+        """
+        :param values: field name -> value for this event
+        :return: RawCampaignObject of a new event with the values set
+        """
+        event = copy(self.event)
+        copied = {(): event}
+        for name, value in values.items():
+            path = tuple(self.fields[name])
+            parent = event
+            for i in range(1, len(path)):
+                if path[:i] not in copied:
+                    copied[path[:i]] = copy(parent[path[i - 1]])
+                    parent[path[i - 1]] = copied[path[:i]]
+                parent = copied[path[:i]]
+            parent[path[-1]] = value
+        return RawCampaignObject(event)
+
+
 def add_drug_campaign(cb, campaign_type, drug_code='', start_days=[0], coverage=1.0, repetitions=3, interval=60,
                       diagnostic_type='TRUE_PARASITE_DENSITY', diagnostic_threshold=40,
                       fmda_radius='hh', node_selection_type='DISTANCE_ONLY',
@@ -78,14 +114,13 @@ def add_drug_campaign(cb, campaign_type, drug_code='', start_days=[0], coverage=
 
     drug_code_drug_configs = []
     if drug_code:
-        # set up intervention drug block
-        drug_code_drug_configs = drug_configs_from_code(cb, drug_code)
-        # update drug dosing if requested
+        # set up intervention drug block, with the requested drug dosing
         if dosing:
-            for i in range(len(drug_code_drug_configs)):
-                drug_code_drug_configs[i]['Dosing_Type'] = dosing
+            drug_code_drug_configs = drug_configs_from_code(cb, drug_code, dosing_type=dosing)
             if 'Vehicle' in drug_code:  # if distributing Vehicle drug
                 receiving_drugs_event["Broadcast_Event"] = "Received_Vehicle"
+        else:
+            drug_code_drug_configs = drug_configs_from_code(cb, drug_code)
 
     # adding adherent_drug_configs to the total drug configs
     drug_configs = drug_code_drug_configs + adherent_drug_configs
@@ -197,34 +232,36 @@ def add_MDA(cb, start_days, coverage, drug_configs, receiving_drugs_event, repet
         cb.add_event(RawCampaignObject(drug_event))
 
     else:
-        for start_day in start_days:
-            drug_event = {
-                "class": "CampaignEvent",
-                "Start_Day": start_day,
-                "Event_Coordinator_Config": {
-                    "class": "StandardInterventionDistributionEventCoordinator",
-                    "Target_Demographic": "Everyone",
-                    "Node_Property_Restrictions": node_property_restrictions,
-                    "Property_Restrictions_Within_Node": ind_property_restrictions,
-                    "Demographic_Coverage": coverage,
-                    "Intervention_Config": {
-                        "class": "MultiInterventionDistributor",
-                        "Intervention_List": interventions
-                    },
-                    "Number_Repetitions": repetitions,
-                    "Timesteps_Between_Repetitions": interval
+        drug_event = {
+            "class": "CampaignEvent",
+            "Start_Day": start_days[0],
+            "Event_Coordinator_Config": {
+                "class": "StandardInterventionDistributionEventCoordinator",
+                "Target_Demographic": "Everyone",
+                "Node_Property_Restrictions": node_property_restrictions,
+                "Property_Restrictions_Within_Node": ind_property_restrictions,
+                "Demographic_Coverage": coverage,
+                "Intervention_Config": {
+                    "class": "MultiInterventionDistributor",
+                    "Intervention_List": interventions
                 },
-                "Nodeset_Config": nodes
-            }
+                "Number_Repetitions": repetitions,
+                "Timesteps_Between_Repetitions": interval
+            },
+            "Nodeset_Config": nodes
+        }
 
-            if target_group != 'Everyone':
-                drug_event['Event_Coordinator_Config'].update({
-                    "Target_Demographic": "ExplicitAgeRanges",  # Otherwise default is Everyone
-                    "Target_Age_Min": target_group['agemin'],
-                    "Target_Age_Max": target_group['agemax']
-                })
+        if target_group != 'Everyone':
+            drug_event['Event_Coordinator_Config'].update({
+                "Target_Demographic": "ExplicitAgeRanges",  # Otherwise default is Everyone
+                "Target_Age_Min": target_group['agemin'],
+                "Target_Age_Max": target_group['agemax']
+            })
 
-            cb.add_event(RawCampaignObject(drug_event))
+        template = CampaignEventTemplate(drug_event, start_day=('Start_Day',), nodes=('Nodeset_Config',),
+                                         coverage=('Event_Coordinator_Config', 'Demographic_Coverage'))
+        for start_day in start_days:
+            cb.add_event(template.stamp(start_day=start_day))
 
 
 def add_MSAT(cb, start_days, coverage, drug_configs, receiving_drugs_event, repetitions, interval,
@@ -330,6 +367,35 @@ def add_fMDA(cb, start_days, trigger_coverage, coverage, drug_configs, receiving
         cb.add_event(RawCampaignObject(fmda_distribute_drugs))
 
     else:
+        fmda_distribute_drugs = {"Event_Name": "Distribute fMDA",
+                                 "class": "CampaignEvent",
+                                 "Start_Day": start_days[0] + treatment_delay,
+                                 "Event_Coordinator_Config":
+                                     {
+                                         "class": "StandardInterventionDistributionEventCoordinator",
+                                         "Intervention_Config": {
+                                             "class": "NodeLevelHealthTriggeredIV",
+                                             "Demographic_Coverage": coverage,
+                                             "Blackout_Event_Trigger": "fMDA_Blackout_Event_Trigger",
+                                             "Blackout_Period": 1,
+                                             "Blackout_On_First_Occurrence": 0,
+                                             "Target_Residents_Only": 1,
+                                             "Node_Property_Restrictions": node_property_restrictions,
+                                             "Property_Restrictions_Within_Node": ind_property_restrictions,
+                                             "Duration": 2, #no confusion, but might as well just leave this 2 days.
+                                             "Trigger_Condition_List": [fmda_trigger],
+                                             "Actual_IndividualIntervention_Config": {
+                                                 "Intervention_List": interventions,
+                                                 "class": "MultiInterventionDistributor"
+                                             }
+                                         }
+                                     },
+                                 "Nodeset_Config": nodes
+                                 }
+        template = CampaignEventTemplate(fmda_distribute_drugs, start_day=('Start_Day',), nodes=('Nodeset_Config',),
+                                         coverage=('Event_Coordinator_Config', 'Intervention_Config',
+                                                   'Demographic_Coverage'))
+
         for start_day in start_days:
             # separate event for each repetition, otherwise RCD and fMDA can get entangled.
             for rep in range(repetitions):
@@ -339,33 +405,7 @@ def add_fMDA(cb, start_days, trigger_coverage, coverage, drug_configs, receiving
                                       node_cfg=nodes, positive_diagnosis_configs=fmda_setup,
                                       IP_restrictions=ind_property_restrictions,
                                       NP_restrictions=node_property_restrictions)
-                fmda_distribute_drugs = {"Event_Name": "Distribute fMDA",
-                                         "class": "CampaignEvent",
-                                         "Start_Day": start_day + interval * rep + treatment_delay,
-                                         "Event_Coordinator_Config":
-                                             {
-                                                 "class": "StandardInterventionDistributionEventCoordinator",
-                                                 "Intervention_Config": {
-                                                     "class": "NodeLevelHealthTriggeredIV",
-                                                     "Demographic_Coverage": coverage,
-                                                     "Blackout_Event_Trigger": "fMDA_Blackout_Event_Trigger",
-                                                     "Blackout_Period": 1,
-                                                     "Blackout_On_First_Occurrence": 0,
-                                                     "Target_Residents_Only": 1,
-                                                     "Node_Property_Restrictions": node_property_restrictions,
-                                                     "Property_Restrictions_Within_Node": ind_property_restrictions,
-                                                     "Duration": 2, #no confusion, but might as well just leave this 2 days.
-                                                     "Trigger_Condition_List": [fmda_trigger],
-                                                     "Actual_IndividualIntervention_Config": {
-                                                         "Intervention_List": interventions,
-                                                         "class": "MultiInterventionDistributor"
-                                                     }
-                                                 }
-                                             },
-                                         "Nodeset_Config": nodes
-                                         }
-
-                cb.add_event(RawCampaignObject(fmda_distribute_drugs))
+                cb.add_event(template.stamp(start_day=start_day + interval * rep + treatment_delay))
 
 
 def add_rfMSAT(cb, start_day, coverage, drug_configs, receiving_drugs_event, interval, treatment_delay,
@@ -1,3 +1,6 @@
+from copy import deepcopy
+
+
 def add_drug_campaign(cb, drug_code, start_days, coverage=1.0, repetitions=3, interval=60):
     # PROPOSE REPLACING THIS FUNCTION WITH VERSION FROM dtk.interventions.malaria_drug_campaigns
     """
@@ -18,7 +21,53 @@ def add_drug_campaign(cb, drug_code, start_days, coverage=1.0, repetitions=3, in
     new_campaign(cb, campaign_type, drugs, start_days=start_days,
                  coverage=coverage, repetitions=repetitions, interval=interval)
 
-def drug_configs_from_code(cb,drug_code):
+class FrozenDict(dict):
+    """
+    Intervention block shared between campaign events; serializes like a dict but cannot be modified in place.
+    copy() and deepcopy() return modifiable dicts.
+    """
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError('Shared intervention blocks cannot be modified; copy the block first')
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _immutable
+
+    def copy(self):
+        return dict(self)
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return deepcopy(dict(self), memo)
+
+    def __reduce__(self):
+        return FrozenDict, (dict(self),)
+
+
+_drug_interventions = {}
+_drug_regimens = {}
+
+
+def antimalarial_drug(drug, dosing_type="FullTreatmentCourse", cost=1.5):
+    """
+    The AntimalarialDrug intervention block for a drug, created once and shared by all callers
+
+    :param drug: Drug_Type, a drug defined in ``drug_params``
+    :param dosing_type: Dosing_Type of the intervention
+    :param cost: Cost_To_Consumer of the intervention
+    :return: A :py:class:`FrozenDict` of the intervention parameters
+    """
+    key = (drug, dosing_type, cost)
+    if key not in _drug_interventions:
+        _drug_interventions[key] = FrozenDict([("class", "AntimalarialDrug"),
+                                               ("Drug_Type", drug),
+                                               ("Dosing_Type", dosing_type),
+                                               ("Cost_To_Consumer", cost)])
+    return _drug_interventions[key]
+
+
+def drug_configs_from_code(cb, drug_code, dosing_type="FullTreatmentCourse"):
     """
     Add a drug config to the simulation configuration based on its code and add the corresponding AntimalarialDrug intervention to the return dictionary.
     The drug_code needs to be one identified in the ``drug_cfg`` dictionary.
@@ -26,26 +75,26 @@ def drug_configs_from_code(cb,drug_code):
     For example passing the ``MDA_ALP`` drug code, will add the drugs config for Artemether, Lumefantrine, Primaquine to the configuration file
     and will return a dictionary containing a Full Treatment course for those 3 drugs.
 
+    The intervention blocks are shared between calls with the same drug code and dosing (see :py:func:`antimalarial_drug`),
+    and the drug parameters are only written to the configuration the first time.
+
     :param cb: The :py:class:`DTKConfigBuilder <dtk.utils.core.DTKConfigBuilder>` that will receive the drug configuration
     :param drug_code: Code of the drug to add
-    :return: A dictionary containing the parameters for an intervention using the given drug
+    :param dosing_type: Dosing_Type of the interventions
+    :return: A list of the interventions using the given drugs
     """
-    dosing_type = "FullTreatmentCourse"
-    drug_array = drug_cfg[drug_code]
+    key = (drug_code, dosing_type)
+    if key not in _drug_regimens:
+        _drug_regimens[key] = tuple(antimalarial_drug(drug, dosing_type) for drug in drug_cfg[drug_code])
 
     cb.set_param("PKPD_Model", "CONCENTRATION_VERSUS_TIME")
 
-    drug_configs = []
-    for drug in drug_array:
-        cb.config["parameters"]["Malaria_Drug_Params"][drug] = drug_params[drug]
-        drug_intervention = {
-            "class": "AntimalarialDrug",
-            "Drug_Type": drug,
-            "Dosing_Type": dosing_type,
-            "Cost_To_Consumer": 1.5
-        }
-        drug_configs.append(drug_intervention)
-    return drug_configs
+    malaria_drug_params = cb.config["parameters"]["Malaria_Drug_Params"]
+    for drug in drug_cfg[drug_code]:
+        if malaria_drug_params.get(drug) is not drug_params[drug]:
+            malaria_drug_params[drug] = drug_params[drug]
+
+    return list(_drug_regimens[key])
 
 def set_drug_param(cb, drugname, parameter, value):
     """
@@ -2,10 +2,10 @@ import logging
 import os
 import numpy as np
 import calendar
-from calibtool.analyzers.Helpers import garki_ento_data
+from malaria.analyzers.Helpers import garki_ento_data
 
 from calibtool.study_sites.EntomologyCalibSite import EntomologyCalibSite
-from calibtool.analyzers.ChannelBySeasonCohortAnalyzer import ChannelBySeasonCohortAnalyzer
+from malaria.analyzers.ChannelBySeasonCohortAnalyzer import ChannelBySeasonCohortAnalyzer
 
 logger = logging.getLogger(__name__)
 
@@ -17,7 +17,8 @@ class GarkiEntoCalibSite(EntomologyCalibSite):
         self.metadata = {
             'village': vname.replace('_', ' '),
             'months': [calendar.month_abbr[i] for i in range(1, 13)],
-            'species': [spec]
+            'species': [spec],
+            'burn_in_days': 2 * 365
         }
 
         super(GarkiEntoCalibSite, self).__init__(vname.replace('_', ' '))
@@ -4,6 +4,7 @@ import numpy as np
 import pandas as pd
 import itertools
 from calibtool.analyzers.Helpers import grouped_df_date
+from malaria.analyzers.Helpers import village_reference_rows
 from collections import OrderedDict
 
 logger = logging.getLogger(__name__)
@@ -62,8 +63,7 @@ class GarkiSites(object):
           ...
 
         """
-        df = pd.read_csv(self.reference_csv)
-        df = df.loc[df['Village'].isin(self.metadata['village'])]
+        df = village_reference_rows(self.reference_csv, self.metadata['village'])
 
         pfprBinsDensity = self.metadata['parasitemia_bins']
         uL_per_field = 0.5 / 200.0  # from Garki PDF - page 111 - 0.5 uL per 200 views
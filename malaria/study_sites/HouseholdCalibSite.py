@@ -7,8 +7,9 @@ import pandas as pd
 from calibtool.CalibSite import CalibSite
 from calibtool.study_sites.site_setup_functions import *
 
-from calibtool.analyzers.PrevalenceByRoundAnalyzer import PrevalenceByRoundAnalyzer
-from calibtool.analyzers.PositiveFractionByDistanceAnalyzer import PositiveFractionByDistanceAnalyzer
+from malaria.analyzers.PrevalenceByRoundAnalyzer import PrevalenceByRoundAnalyzer
+from malaria.analyzers.PositiveFractionByDistanceAnalyzer import PositiveFractionByDistanceAnalyzer
+from malaria.analyzers.Helpers import load_distance_ring_index
 
 logger = logging.getLogger(__name__)
 
@@ -44,7 +45,7 @@ class HouseholdCalibSite(CalibSite):
             "prev": [0] * 6,
             "round": [1, 2, 3, 4, 5, 6],
             "grid_cell": ['all'] * 6,
-            'sim_date': [0] * 6
+            'sim_date': [0, 1, 2, 3, 4, 5]  # placeholder: one distinct simulation day per round
         }
     }
 
@@ -164,6 +165,16 @@ class HouseholdCalibSite(CalibSite):
         except IOError :
             return None
 
+    def get_distance_ring_index(self):
+        """
+        Neighbors by distance ring for 'risk_by_distance', cached next to distance_matrix_fname and memory-mapped
+        """
+        try:
+            return load_distance_ring_index(self.metadata['distance_matrix_fname'],
+                                            self.reference_dict['risk_by_distance']['distances'])
+        except IOError:
+            return None
+
     def get_analyzers(self):
         return [PrevalenceByRoundAnalyzer(site=self),
                 PositiveFractionByDistanceAnalyzer(site=self, testday=self.metadata['distance_testday'])
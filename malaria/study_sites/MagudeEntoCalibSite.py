@@ -5,7 +5,7 @@ import calendar
 from calibtool.analyzers.Helpers import ento_data
 
 from calibtool.study_sites.EntomologyCalibSite import EntomologyCalibSite
-from calibtool.analyzers.ChannelBySeasonCohortAnalyzer import ChannelBySeasonCohortAnalyzer
+from malaria.analyzers.ChannelBySeasonCohortAnalyzer import ChannelBySeasonCohortAnalyzer
 
 logger = logging.getLogger(__name__)
 
@@ -14,7 +14,8 @@ class MagudeEntoCalibSite(EntomologyCalibSite):
     metadata = {
         'village': 'Magude',
         'months': [calendar.month_abbr[i] for i in range(1, 13)],
-        'species': ['gambiae']
+        'species': ['gambiae'],
+        'burn_in_days': 2 * 365
     }
 
     def get_reference_data(self, reference_type):
@@ -1,7 +1,7 @@
 import logging
 import os
 import numpy as np
-from calibtool.analyzers.Helpers import season_channel_age_density_csv_to_pandas
+from malaria.analyzers.Helpers import season_channel_age_density_csv_to_pandas
 
 from calibtool.study_sites.DensityCalibSite import DensityCalibSite
 
@@ -2,7 +2,7 @@ import logging
 import os
 import numpy as np
 import calendar
-from calibtool.analyzers.Helpers import garki_ento_data
+from malaria.analyzers.Helpers import garki_ento_data
 
 from calibtool.study_sites.EntomologyCalibSite import EntomologyCalibSite
 
@@ -429,6 +429,24 @@ class add_itn_age_season_fn:
                            discard=self.discard)
 
 
+def coverage_by_node_group(coverages, fracs):
+    """
+    Per-distribution coverage of node groups, corrected so that the fraction of each group covered at least once
+    by the distribution and the later ones is coverage * frac:
+    c[g, i] = coverages[g] * fracs[i] / prod_{j > i}(1 - fracs[j] * coverages[g])
+
+    :param coverages: coverage of each node group
+    :param fracs: fraction of the coverage distributed at each date
+    :return: (groups x dates) array of coverages
+    """
+    coverages = np.asarray(coverages, dtype=float)[:, np.newaxis]
+    fracs = np.asarray(fracs, dtype=float)[np.newaxis, :]
+    not_covered = 1 - fracs * coverages
+    later = np.ones_like(not_covered)
+    later[:, :-1] = np.cumprod(not_covered[:, :0:-1], axis=1)[:, ::-1]
+    return coverages * fracs / later
+
+
 # ITNs from nodeid-coverage specified in json
 class add_itn_by_node_id_fn:
     def __init__(self, reffname, itn_dates, itn_fracs, channel='itn2012cov', waning=None):
@@ -443,21 +461,21 @@ class add_itn_by_node_id_fn:
 
     def fn(self, cb) :
         birth_durations = [self.itn_dates[x] - self.itn_dates[x + 1] for x in range(len(self.itn_dates) - 1)]
-        # itn_distr = zip(self.itn_dates[:-1], self.itn_fracs)
         with open(self.reffname) as fin :
             cov = json.loads(fin.read())
-        for itncov in cov[self.channel] :
-            if itncov['coverage'] > 0 :
-                for i, (itn_date, itn_frac) in enumerate(zip(self.itn_dates, self.itn_fracs)):
-                    c = itncov['coverage'] * itn_frac
-                    if i < len(self.itn_fracs) - 1:
-                        c /= np.prod([1 - x * itncov['coverage'] for x in self.itn_fracs[i + 1:]])
-                    add_ITN(cb, itn_date,
-                            coverage_by_ages=[{'min': 0, 'max': 5, 'coverage': min([1, c*1.3])},
-                                              {'birth': 1, 'coverage': min([1,c*1.3]), 'duration': max([-1, birth_durations[i]])},
-                                              {'min': 5, 'max': 20, 'coverage': c / 2},
-                                              {'min': 20, 'max': 100, 'coverage': min([1, c*1.3])}],
-                            waning=self.waning, nodeIDs=itncov['nodes'])
+        groups = [itncov for itncov in cov[self.channel] if itncov['coverage'] > 0]
+        if not groups:
+            return
+        coverage = coverage_by_node_group([itncov['coverage'] for itncov in groups], self.itn_fracs)
+        dates = self.itn_dates[:coverage.shape[1]]
+        for itncov, group_coverage in zip(groups, coverage):
+            for i, (itn_date, c) in enumerate(zip(dates, group_coverage.tolist())):
+                add_ITN(cb, itn_date,
+                        coverage_by_ages=[{'min': 0, 'max': 5, 'coverage': min([1, c*1.3])},
+                                          {'birth': 1, 'coverage': min([1,c*1.3]), 'duration': max([-1, birth_durations[i]])},
+                                          {'min': 5, 'max': 20, 'coverage': c / 2},
+                                          {'min': 20, 'max': 100, 'coverage': min([1, c*1.3])}],
+                        waning=self.waning, nodeIDs=itncov['nodes'])
 
 
 # IRS
@@ -477,37 +495,52 @@ class add_irs_fn:
 
 # IRS from nodeid-coverage specified in json
 class add_node_level_irs_by_node_id_fn:
+    """
+    Node-level IRS of the node groups in the reffname JSON channel, spread over irs_dates by irs_fracs:
+    each node of a group is sprayed at each date with the coverage_by_node_group probability.
+
+    N.B. Under Python 3 this used to add no IRS events at all, as the zip of dates and fractions was exhausted by
+         the first node group before the events were added; it now adds them for every group, as under Python 2.
+         Campaigns built with it before that fix had no node-level IRS.
+
+    :param seed: seed of the node draws, None to draw from the global numpy random state
+    """
+
     def __init__(self, reffname, irs_dates, irs_fracs, channel='irs2012cov',
-                                     initial_killing=0.5, box_duration=90):
+                                     initial_killing=0.5, box_duration=90, seed=None):
         self.reffname = reffname
         self.irs_dates = irs_dates
         self.irs_fracs = irs_fracs
         self.channel = channel
         self.initial_killing = initial_killing
         self.box_duration = box_duration
+        self.seed = seed
 
     def __call__(self, cb):
         return self.fn(cb)
 
     def fn(self, cb):
-        nodelist = {x: [] for x in self.irs_dates}
-
-        irs_distr = zip(self.irs_dates, self.irs_fracs)
         with open(self.reffname) as fin:
             cov = json.loads(fin.read())
-        for irscov in cov[self.channel]:
-            if irscov['coverage'] > 0:
-                for i, (irs_date, irs_frac) in enumerate(irs_distr):
-                    c = irscov['coverage'] * irs_frac
-                    if i < len(self.irs_fracs) - 1:
-                        c /= np.prod([1 - x * irscov['coverage'] for x in self.irs_fracs[i + 1:]])
-                    nodeIDs = [x for x in irscov['nodes'] if np.random.random() <= c]
-                    nodelist[irs_date] += nodeIDs
-
-        for i, (irs_date, irs_frac) in enumerate(irs_distr):
-            if len(nodelist[irs_date]) > 0 :
+        groups = [irscov for irscov in cov[self.channel] if irscov['coverage'] > 0]
+        if not groups:
+            return
+        coverage = coverage_by_node_group([irscov['coverage'] for irscov in groups], self.irs_fracs)
+
+        # one draw per node and date, compared to the coverage of the node's group at that date
+        nodes = np.concatenate([np.asarray(irscov['nodes'], dtype=np.int64) for irscov in groups])
+        node_coverage = np.repeat(coverage, [len(irscov['nodes']) for irscov in groups], axis=0)
+        if self.seed is None:
+            draws = np.random.random_sample(node_coverage.shape)
+        else:
+            draws = np.random.RandomState(self.seed).random_sample(node_coverage.shape)
+        sprayed = draws <= node_coverage
+
+        for i, irs_date in enumerate(self.irs_dates[:coverage.shape[1]]):
+            nodeIDs = nodes[sprayed[:, i]].tolist()
+            if len(nodeIDs) > 0 :
                 add_node_IRS(cb, irs_date, initial_killing=self.initial_killing,
-                             box_duration=self.box_duration, nodeIDs=nodelist[irs_date])
+                             box_duration=self.box_duration, nodeIDs=nodeIDs)
 
 
 # drug campaign
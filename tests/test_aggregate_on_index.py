@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from malaria.analyzers.Helpers import aggregate_on_index
+
+
+def aggregate_on_index_groupby(df, index, keep):
+    """
+    Frozen copy of the pd.cut/groupby aggregation replaced by the binning-plan kernel
+    """
+    levels = index.levels if isinstance(index, pd.MultiIndex) else [index]
+    for ix in levels:
+        if ix.dtype == 'object' or pd.api.types.is_string_dtype(ix.dtype):  # str levels of recent pandas
+            df = df[df[ix.name].isin(ix.values)]
+        else:
+            bin_edges = np.concatenate(([-np.inf], ix.values))
+            df = df.assign(**{ix.name: pd.cut(df[ix.name], bin_edges, labels=ix.values)})
+    return df.groupby([ix.name for ix in levels], observed=False).sum()[keep].dropna()
+
+
+@pytest.fixture
+def sim_df():
+    rng = np.random.RandomState(0)
+    n = 200
+    df = pd.DataFrame({'Age Bin': rng.uniform(0, 30, n),
+                       'Season': pd.Series(rng.choice(['DC', 'W', 'XX'], n), dtype=object),
+                       'Counts': rng.poisson(3, n).astype(float),
+                       'Population': rng.randint(0, 5, n)})
+    df.loc[[1, 5], 'Counts'] = np.nan
+    df.loc[7, 'Counts'] = np.inf
+    df.loc[9, 'Age Bin'] = np.nan
+    return df
+
+
+@pytest.mark.parametrize('index', [
+    pd.MultiIndex.from_product([[1, 5, 10, 15, 50, 100.0], ['DC', 'W', 'DH']], names=['Age Bin', 'Season']),
+    pd.MultiIndex.from_product([['DC', 'W'], [0.5, 1, 5, 10, 20, 25, 100]], names=['Season', 'Age Bin']),
+    pd.Index([1, 5, 10, 15, 50, 100.0], name='Age Bin'),
+])
+def test_matches_groupby(sim_df, index):
+    expected = aggregate_on_index_groupby(sim_df, index, ['Counts', 'Population'])
+    result = aggregate_on_index(sim_df, index, keep=['Counts', 'Population'])
+
+    assert result.index.tolist() == expected.index.tolist()
+    np.testing.assert_array_equal(result['Counts'].values, expected['Counts'].values)
+    np.testing.assert_array_equal(result['Population'].values, expected['Population'].values)
+    assert np.isinf(result['Counts']).any()
+
+
+def test_empty_bins_are_zero(sim_df):
+    index = pd.Index([-10, -5, 1, 100.0], name='Age Bin')
+    result = aggregate_on_index(sim_df, index, keep=['Counts'])
+
+    assert result.index.tolist() == index.tolist()
+    assert result.loc[[-10, -5], 'Counts'].tolist() == [0, 0]
+    assert aggregate_on_index(sim_df.iloc[:0], index, keep=['Counts'])['Counts'].tolist() == [0, 0, 0, 0]
@@ -0,0 +1,143 @@
+import itertools
+from math import lgamma, log, sqrt
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from malaria.analyzers import BatchLLCalculators
+
+
+def rate_data(seed, n_samples=4):
+    """ Simulated and reference Observations/Trials by age bin, with missing bins on both sides """
+    rng = np.random.RandomState(seed)
+    index = pd.Index([0.5, 1, 2, 4, 8, 15, 100], name='Age Bin')
+    trials = rng.uniform(20, 200, len(index))
+    reference = pd.DataFrame({'Observations': np.floor(trials * rng.uniform(0, 1, len(index))), 'Trials': trials},
+                             index=index)
+    reference.iloc[2, 0] = np.nan
+
+    columns = pd.MultiIndex.from_product([range(n_samples), ['Observations', 'Trials']], names=['sample', 'channel'])
+    data = pd.DataFrame(index=index, columns=columns, dtype=float)
+    for sample in range(n_samples):
+        sim_trials = rng.uniform(500, 5000, len(index))
+        data[(sample, 'Trials')] = sim_trials
+        data[(sample, 'Observations')] = sim_trials * rng.uniform(0, 1, len(index))
+    data.iloc[4, 0] = np.nan
+    return data, reference
+
+
+def count_data(seed, n_samples=4):
+    """ Simulated and reference Counts by (Channel, Season, Age Bin, PfPR Bin) """
+    rng = np.random.RandomState(seed)
+    index = pd.MultiIndex.from_tuples(list(itertools.product(['PfPR by Parasitemia and Age Bin'], ['DC', 'W'],
+                                                             [5, 15, 100], [0, 50, 500, 5000])),
+                                      names=['Channel', 'Season', 'Age Bin', 'PfPR Bin'])
+    reference = pd.DataFrame({'Counts': rng.randint(0, 30, len(index)).astype(float)}, index=index)
+    reference.iloc[3, 0] = np.nan
+
+    columns = pd.MultiIndex.from_product([range(n_samples), ['Counts']], names=['sample', 'channel'])
+    data = pd.DataFrame(rng.uniform(0, 100, (len(index), n_samples)), index=index, columns=columns)
+    data.iloc[6, 1] = np.nan
+    return data, reference
+
+
+def scalar_bins(data, reference, sample):
+    """ (bin, sim row, ref row) of a sample's bins with no missing value, as join_reference keeps them """
+    sim = data[sample]
+    for key in reference.index:
+        s, r = sim.loc[key], reference.loc[key]
+        if not (s.isnull().any() or r.isnull().any()):
+            yield key, s, r
+
+
+def beta_binomial_scalar(data, reference, sample):
+    ll = [lgamma(r.Trials + 1) + lgamma(s.Trials + 2) - lgamma(r.Trials + s.Trials + 2)
+          + lgamma(r.Observations + s.Observations + 1)
+          + lgamma(r.Trials - r.Observations + s.Trials - s.Observations + 1)
+          - lgamma(r.Observations + 1) - lgamma(r.Trials - r.Observations + 1)
+          - lgamma(s.Observations + 1) - lgamma(s.Trials - s.Observations + 1)
+          for _, s, r in scalar_bins(data, reference, sample)]
+    return sum(ll) / len(ll)
+
+
+def gamma_poisson_scalar(data, reference, sample):
+    ll = [lgamma(r.Observations + s.Observations + 1) - lgamma(r.Observations + 1) - lgamma(s.Observations + 1)
+          + r.Observations * log(r.Trials) + (s.Observations + 1) * log(s.Trials)
+          - (r.Observations + s.Observations + 1) * log(r.Trials + s.Trials)
+          for _, s, r in scalar_bins(data, reference, sample)]
+    return sum(ll) / len(ll)
+
+
+def dirichlet_multinomial_scalar(data, reference, sample):
+    groups = {}
+    for key, s, r in scalar_bins(data, reference, sample):
+        groups.setdefault(key[:-1], []).append((r.Counts, s.Counts + 1))
+    ll = 0
+    for bins in groups.values():
+        n, a = sum(x for x, _ in bins), sum(alpha for _, alpha in bins)
+        ll += lgamma(n + 1) + lgamma(a) - lgamma(n + a)
+        ll += sum(lgamma(x + alpha) - lgamma(alpha) - lgamma(x + 1) for x, alpha in bins)
+    return ll
+
+
+def euclidean_distance_scalar(data, reference, sample):
+    return -sqrt(sum((s.Counts - r.Counts) ** 2 for _, s, r in scalar_bins(data, reference, sample)))
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+@pytest.mark.parametrize('name,make_data', [('beta_binomial', rate_data), ('gamma_poisson', rate_data),
+                                            ('dirichlet_multinomial', count_data),
+                                            ('euclidean_distance', count_data)])
+def test_matches_scalar_formula(seed, name, make_data):
+    data, reference = make_data(seed)
+    scalar = globals()[name + '_scalar']
+    expected = [scalar(data, reference, sample) for sample in data.columns.get_level_values('sample').unique()]
+    result = getattr(BatchLLCalculators, name)(data, reference)
+    np.testing.assert_allclose(result.values, expected, rtol=1e-10)
+
+
+@pytest.fixture
+def calibtool_analyzers():
+    LL_calculators = pytest.importorskip('calibtool.LL_calculators')
+    from malaria.analyzers.BaseSummaryCalibrationAnalyzer import BaseSummaryCalibrationAnalyzer
+    return LL_calculators, BaseSummaryCalibrationAnalyzer
+
+
+def per_sample(analyzer_class, compare_fn, data, reference):
+    """ The per-sample path: compare_fn on join_reference of each sample """
+    return pd.Series({sample: compare_fn(analyzer_class.join_reference(data[[sample]].copy(), reference))
+                      for sample in data.columns.get_level_values('sample').unique()})
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+@pytest.mark.parametrize('name,make_data', [('beta_binomial', rate_data), ('gamma_poisson', rate_data),
+                                            ('dirichlet_multinomial', count_data),
+                                            ('euclidean_distance', count_data)])
+def test_matches_per_sample(calibtool_analyzers, seed, name, make_data):
+    LL_calculators, BaseSummaryCalibrationAnalyzer = calibtool_analyzers
+    data, reference = make_data(seed)
+    expected = per_sample(BaseSummaryCalibrationAnalyzer, getattr(LL_calculators, name + '_pandas'), data, reference)
+    result = getattr(BatchLLCalculators, name)(data, reference)
+    np.testing.assert_allclose(result.values, expected.values.astype(float), rtol=1e-10)
+
+
+def test_batch_compare_fn_hook(calibtool_analyzers):
+    _, BaseSummaryCalibrationAnalyzer = calibtool_analyzers
+
+    class StaticMethodAnalyzer(BaseSummaryCalibrationAnalyzer):
+        batch_compare_fn = staticmethod(BatchLLCalculators.gamma_poisson)
+
+        def __init__(self, data, reference):
+            self.data, self.reference = data, reference
+
+    class InstanceAnalyzer(StaticMethodAnalyzer):
+        def __init__(self, data, reference):
+            super(InstanceAnalyzer, self).__init__(data, reference)
+            self.batch_compare_fn = BatchLLCalculators.gamma_poisson
+
+    data, reference = rate_data(0)
+    for analyzer_class in (StaticMethodAnalyzer, InstanceAnalyzer):
+        analyzer = analyzer_class(data, reference)
+        analyzer.finalize()
+        pd.testing.assert_series_equal(analyzer.result, BatchLLCalculators.gamma_poisson(data, reference))
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+site_setup_functions = pytest.importorskip('malaria.study_sites.site_setup_functions')
+
+
+def coverage_by_node_group_loop(coverages, fracs):
+    """
+    Frozen copy of the per-group, per-date np.prod correction replaced by coverage_by_node_group
+    """
+    result = []
+    for coverage in coverages:
+        row = []
+        for i, frac in enumerate(fracs):
+            c = coverage * frac
+            if i < len(fracs) - 1:
+                c /= np.prod([1 - x * coverage for x in fracs[i + 1:]])
+            row.append(c)
+        result.append(row)
+    return np.array(result)
+
+
+@pytest.mark.parametrize('fracs', [[1.0], [0.5, 0.5], [0.2, 0.3, 0.5], [0.7, 0.0, 0.3, 1.0]])
+def test_matches_loop(fracs):
+    coverages = [0.05, 0.3, 0.6, 0.95, 1.0]
+    np.testing.assert_allclose(site_setup_functions.coverage_by_node_group(coverages, fracs),
+                               coverage_by_node_group_loop(coverages, fracs), rtol=1e-12)
+
+
+def test_random_groups_match_loop():
+    rng = np.random.RandomState(0)
+    coverages = rng.uniform(0, 1, 50)
+    fracs = rng.dirichlet(np.ones(6))
+    np.testing.assert_allclose(site_setup_functions.coverage_by_node_group(coverages, fracs),
+                               coverage_by_node_group_loop(coverages, fracs), rtol=1e-12)
@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from malaria.analyzers.Helpers import get_risk_by_distance, DistanceRingIndex, load_distance_ring_index
+
+
+def get_risk_by_distance_loop(df_sim, distances, ddf):
+    """
+    Frozen copy of the ring x household x pair loop replaced by DistanceRingIndex (.ix lookups written as .loc)
+    """
+    nodelist = df_sim['node'].values.tolist()
+    rel_risk = []
+
+    for k, n_dist in enumerate(distances):
+        pos_w_pos = 0.
+        tot_w_pos = 0.
+
+        for hh_num in df_sim.index:
+            if df_sim.loc[hh_num, 'pos'] < 1:
+                continue
+
+            if n_dist == 0 and df_sim.loc[hh_num, 'pop'] > 1:
+                hh_pos = df_sim.loc[hh_num, 'pos']
+                hh_tot = df_sim.loc[hh_num, 'pop']
+                num_pos = (hh_pos - 1)*hh_pos
+                num_ppl = (hh_tot - 1)*hh_pos
+
+            else:
+                # node IDs of nodes within distance
+                neighbors = ddf[(ddf['node1'] == nodelist[hh_num]) & (ddf['node2'] != nodelist[hh_num]) &
+                                (ddf['dist'] <= n_dist) & (ddf['dist'] > distances[k-1])]['node2'].values
+
+                ndf = df_sim[df_sim['node'].isin(neighbors)]
+                num_pos = sum(ndf['pos'].values)
+                num_ppl = sum(ndf['pop'].values)
+
+            pos_w_pos += num_pos
+            tot_w_pos += num_ppl
+
+        if tot_w_pos > 0:
+            rel_risk.append(pos_w_pos/tot_w_pos)
+        else:
+            rel_risk.append(0)
+
+    return rel_risk
+
+
+def household_layout(seed, n_households=60, missing_nodes=5):
+    """
+    Households on a unit square with all pairwise distances, including self-pairs, duplicate pairs,
+    pairs to nodes absent from the simulation and simulation nodes absent from the distance table
+    """
+    rng = np.random.RandomState(seed)
+    nodes = rng.choice(np.arange(1, 10 * n_households), n_households, replace=False)
+    xy = rng.uniform(0, 0.5, (n_households, 2))
+    dist = np.sqrt(((xy[:, None, :] - xy[None, :, :]) ** 2).sum(axis=-1))
+    node1, node2 = np.meshgrid(nodes, nodes, indexing='ij')
+    ddf = pd.DataFrame({'node1': node1.ravel(), 'node2': node2.ravel(), 'dist': dist.ravel()})
+    ddf = ddf[~ddf['node1'].isin(nodes[:missing_nodes])]
+    ddf = pd.concat([ddf, ddf.iloc[:20], pd.DataFrame({'node1': [nodes[-1]], 'node2': [-1], 'dist': [0.01]})],
+                    ignore_index=True)
+
+    pop = rng.randint(1, 8, n_households).astype(float)
+    pos = np.floor(pop * rng.uniform(0, 1, n_households) ** 2)
+    df_sim = pd.DataFrame({'node': nodes, 'pop': pop, 'pos': pos})
+    return df_sim, ddf
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+@pytest.mark.parametrize('distances', [[0, 0.05, 0.2],
+                                       [0, 0.05, 0.2, 0.2001],  # empty outer ring
+                                       [0.05, 0.2]])
+def test_matches_loop(seed, distances):
+    df_sim, ddf = household_layout(seed)
+    expected = get_risk_by_distance_loop(df_sim, distances, ddf)
+    np.testing.assert_allclose(get_risk_by_distance(df_sim, distances, ddf), expected, rtol=1e-12)
+
+    index = DistanceRingIndex.from_frame(ddf, distances)
+    np.testing.assert_allclose(get_risk_by_distance(df_sim, distances, index), expected, rtol=1e-12)
+
+
+def test_matches_loop_with_nans_and_no_positives():
+    distances = [0, 0.05, 0.2]
+    df_sim, ddf = household_layout(3)
+
+    nan_pos = df_sim.copy()
+    nan_pos.loc[[2, 7], 'pos'] = np.nan
+    np.testing.assert_allclose(get_risk_by_distance(nan_pos, distances, ddf),
+                               get_risk_by_distance_loop(nan_pos, distances, ddf), rtol=1e-12)
+
+    no_pos = df_sim.assign(pos=0.)
+    assert get_risk_by_distance(no_pos, distances, ddf) == get_risk_by_distance_loop(no_pos, distances, ddf)
+
+
+def test_cached_index_matches_loop(tmp_path):
+    distances = [0, 0.05, 0.2]
+    df_sim, ddf = household_layout(4)
+    csvfilename = str(tmp_path / 'distances.csv')
+    ddf.to_csv(csvfilename, index=False)
+    expected = get_risk_by_distance_loop(df_sim, distances, pd.read_csv(csvfilename))
+
+    built = load_distance_ring_index(csvfilename, distances)
+    loaded = load_distance_ring_index(csvfilename, distances)
+    for index in (built, loaded):
+        np.testing.assert_allclose(get_risk_by_distance(df_sim, distances, index), expected, rtol=1e-12)
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from malaria.analyzers.Helpers import iter_vector_stats, vector_stats_by_month, month_from_day_of_year
+
+
+@pytest.fixture
+def vector_stats_csv(tmp_path):
+    """ A time-ordered ReportVectorStats.csv over two years, 3 nodes and 2 species, with an extra column """
+    rng = np.random.RandomState(0)
+    time = np.repeat(np.arange(730, dtype=float), 6)
+    df = pd.DataFrame({'Time': time,
+                       'NodeID': np.tile(np.repeat([3, 1, 2], 2), 730),
+                       'Species': np.tile(['gambiae', 'funestus'], 3 * 730),
+                       'Population': rng.randint(0, 50, len(time)).astype(float),
+                       'VectorPopulation': rng.uniform(0, 500, len(time)),
+                       'AdultCount': rng.randint(0, 100, len(time))})
+    path = str(tmp_path / 'ReportVectorStats.csv')
+    df.to_csv(path, index=False, sep=',', float_format='%.6f')
+    return path, pd.read_csv(path)
+
+
+def vector_stats_by_month_groupby(df, burn_in_days):
+    df = df[df['Time'] >= burn_in_days]
+    df = df.assign(day=((df['Time'] + 1) % 365).astype(int),
+                   ratio=df['VectorPopulation'] / df['Population'])
+    daily = df.groupby(['day', 'NodeID', 'Species'])['ratio'].mean().reset_index()
+    daily['Month'] = month_from_day_of_year(np.arange(1, 366))[daily['day'].values]
+    monthly = daily.groupby(['Species', 'Month', 'NodeID'])['ratio'].mean()
+    return monthly.rename('Vector_per_Human').reset_index()
+
+
+@pytest.mark.parametrize('burn_in_days', [0, 100, 400])
+def test_streamed_file_matches_frame(vector_stats_csv, burn_in_days):
+    path, df = vector_stats_csv
+    from_file = vector_stats_by_month(path, burn_in_days=burn_in_days, chunksize=1000)
+    from_frame = vector_stats_by_month(df, burn_in_days=burn_in_days, chunksize=1000)
+    pd.testing.assert_frame_equal(from_file, from_frame)
+
+    expected = vector_stats_by_month_groupby(df, burn_in_days)
+    np.testing.assert_array_equal(from_file[['Month', 'NodeID']].values, expected[['Month', 'NodeID']].values)
+    assert from_file['Species'].tolist() == expected['Species'].tolist()
+    np.testing.assert_allclose(from_file['Vector_per_Human'].values, expected['Vector_per_Human'].values,
+                               rtol=1e-12)
+
+
+def test_streamed_chunks_drop_burn_in(vector_stats_csv):
+    path, df = vector_stats_csv
+    chunks = list(iter_vector_stats(path, burn_in_days=400, chunksize=1000))
+    streamed = pd.concat(chunks)
+    assert all(len(chunk) for chunk in chunks)
+    assert streamed['Time'].min() == 400
+    assert len(streamed) == (df['Time'] >= 400).sum()
+    assert list(streamed.columns) == ['Time', 'NodeID', 'Species', 'Population', 'VectorPopulation']
@@ -0,0 +1,42 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from malaria.analyzers import Helpers
+from malaria.analyzers.Helpers import village_reference_rows, village_store_filename
+
+
+@pytest.fixture
+def garki_csv(tmp_path):
+    rng = np.random.RandomState(0)
+    n = 40
+    df = pd.DataFrame({'Patient_id': np.arange(n),
+                       'Village': rng.choice(['Sugungum', 'Matsari', 'Rafin Marke'], n),
+                       'Seasons': rng.choice(['DC2', 'W2', None], n),
+                       'Age': rng.uniform(0, 80, n),
+                       'Parasitemia': rng.choice([0.0, 40.0, np.nan], n)})
+    df['Notes'] = np.where(df['Village'] == 'Sugungum', 'slide reread', None)  # all missing in other villages
+    path = str(tmp_path / 'inputs' / 'garki_df.csv')
+    os.makedirs(os.path.dirname(path))
+    df.to_csv(path, index=False)
+    return path
+
+
+def test_store_matches_csv(garki_csv, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    expected = pd.read_csv(garki_csv)
+    expected = expected[expected['Village'].isin(['Matsari', 'Sugungum'])]
+
+    Helpers._village_stores.clear()
+    parsed = village_reference_rows(garki_csv, ['Matsari', 'Sugungum'], cache_dir=cache_dir)
+    assert os.path.exists(village_store_filename(garki_csv, cache_dir))
+    assert os.listdir(os.path.dirname(garki_csv)) == ['garki_df.csv']
+
+    Helpers._village_stores.clear()
+    loaded = village_reference_rows(garki_csv, ['Matsari', 'Sugungum'], cache_dir=cache_dir)
+
+    pd.testing.assert_frame_equal(parsed, expected)
+    pd.testing.assert_frame_equal(loaded, expected)
+    assert loaded.dtypes.tolist() == parsed.dtypes.tolist() == expected.dtypes.tolist()